@@ -0,0 +1,128 @@
+# coding: utf-8
+"""
+    Benchmark the wave primitives of :mod:`captcha.audio`, comparing the
+    pure Python implementation against the NumPy engine, and the peak
+    memory of a request with and without streaming::
+
+        $ python -m benchmarks.bench_audio
+"""
+
+import os
+import timeit
+import contextlib
+import tracemalloc
+
+from captcha import audio
+
+
+PRIMITIVES = [
+    ('change_speed', lambda f, body: f(body, 1.13)),
+    ('change_sound', lambda f, body: f(body, 0.87)),
+    ('mix_wave', lambda f, body: f(body, bytearray(body))),
+    ('create_noise', lambda f, body: f(len(body), 4)),
+    ('create_silence', lambda f, body: f(len(body))),
+]
+
+
+@contextlib.contextmanager
+def python_engine():
+    """Run :mod:`captcha.audio` on the pure Python primitives."""
+    names = [name for name, _ in PRIMITIVES]
+    saved = dict((name, getattr(audio, name)) for name in names)
+    try:
+        for name in names:
+            setattr(audio, name, getattr(audio, '_py_' + name))
+        yield
+    finally:
+        for name in names:
+            setattr(audio, name, saved[name])
+
+
+def best_of(func, number, repeat=3):
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def bench_primitives(body, number=5):
+    rows = []
+    for name, call in PRIMITIVES:
+        python = getattr(audio, '_py_' + name)
+        row = [name, best_of(lambda: call(python, body), number)]
+        if audio._engine is not None:
+            engine = getattr(audio._engine, name)
+            row.append(best_of(lambda: call(engine, body), number))
+        rows.append(row)
+    return rows
+
+
+def bench_wave_body(chars='123456', number=3):
+    captcha = audio.AudioCaptcha()
+    captcha.load()
+
+    def run():
+        captcha.reseed(0)
+        captcha.create_wave_body(chars)
+
+    rv = [best_of(run, number)]
+    if audio._engine is not None:
+        with python_engine():
+            rv.insert(0, best_of(run, number))
+    return ['create_wave_body'] + rv
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_memory(chars='123456'):
+    captcha = audio.AudioCaptcha()
+    captcha.load()
+
+    def generate():
+        captcha.reseed(0)
+        with open(os.devnull, 'wb') as f:
+            f.write(captcha.generate(chars))
+
+    def stream():
+        captcha.reseed(0)
+        with open(os.devnull, 'wb') as f:
+            captcha.write(chars, f)
+
+    rows = []
+    for name, func in (('generate', generate), ('stream', stream)):
+        with python_engine():
+            row = [name, peak_memory(func)]
+        if audio._engine is not None:
+            row.append(peak_memory(func))
+        rows.append(row)
+    return rows
+
+
+def main():
+    body = audio.create_noise(audio.WAVE_SAMPLE_RATE * 5)
+    rows = bench_primitives(body)
+    rows.append(bench_wave_body())
+
+    print('%-18s %12s %12s %8s' % ('primitive', 'python (ms)',
+                                   'numpy (ms)', 'speedup'))
+    for row in rows:
+        if len(row) == 3:
+            name, python, engine = row
+            print('%-18s %12.2f %12.2f %7.1fx' % (
+                name, python * 1000, engine * 1000, python / engine))
+        else:
+            print('%-18s %12.2f %12s %8s' % (row[0], row[1] * 1000, '-', '-'))
+
+    print('')
+    print('%-18s %12s %12s' % ('peak memory (KiB)', 'python', 'numpy'))
+    for row in bench_memory():
+        print('%-18s' % row[0] + ''.join(
+            ' %12.1f' % (peak / 1024.0) for peak in row[1:]))
+
+
+if __name__ == '__main__':
+    main()
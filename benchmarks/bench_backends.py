@@ -0,0 +1,63 @@
+# coding: utf-8
+"""
+    Compare the image backends, :class:`captcha.image.ImageCaptcha` and
+    :class:`captcha.image.WheezyCaptcha`: the time to render an image and
+    to render and encode it, for each size and text length::
+
+        $ python -m benchmarks.bench_backends
+"""
+
+from captcha.image import ImageCaptcha, WheezyCaptcha, wheezy_captcha
+from captcha.instrument import clock
+
+SIZES = [(160, 60), (200, 75), (320, 120)]
+LENGTHS = [4, 6]
+CHARS = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+
+
+def backends(width, height):
+    rv = {'image': ImageCaptcha(width, height, seed=0)}
+    if wheezy_captcha is not None:
+        rv['wheezy'] = WheezyCaptcha(width, height)
+    return rv
+
+
+def bench_backends(iterations, sizes=SIZES, lengths=LENGTHS, format='png'):
+    """Return the render times and the render and encode times in seconds,
+    by ``backend/size/length`` name."""
+    results = {}
+    for width, height in sizes:
+        for backend, captcha in sorted(backends(width, height).items()):
+            # warm up the fonts and the caches
+            captcha.generate(CHARS[:8], format)
+            for length in lengths:
+                texts = [''.join(CHARS[(i * 7 + j * 13) % len(CHARS)]
+                                 for j in range(length))
+                         for i in range(iterations)]
+                render = []
+                total = []
+                for chars in texts:
+                    start = clock()
+                    captcha.generate_image(chars)
+                    render.append(clock() - start)
+                    start = clock()
+                    captcha.generate(chars, format)
+                    total.append(clock() - start)
+                name = '%s/%dx%d/len%d' % (backend, width, height, length)
+                results[name] = {'render': render, format: total}
+    return results
+
+
+def main():
+    results = bench_backends(20)
+    print('%-24s %10s %10s' % ('backend/size/length', 'render ms', 'png ms'))
+    for name in sorted(results):
+        row = []
+        for stage in ('render', 'png'):
+            samples = sorted(results[name][stage])
+            row.append(samples[len(samples) // 2] * 1000)
+        print('%-24s %10.3f %10.3f' % (name, row[0], row[1]))
+
+
+if __name__ == '__main__':
+    main()
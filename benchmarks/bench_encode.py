@@ -0,0 +1,71 @@
+# coding: utf-8
+"""
+    Benchmark the encoder profiles of :func:`captcha.image.encode_image`:
+    the encode time and the payload size of each format, profile and
+    palette size, on the same set of generated images::
+
+        $ python -m benchmarks.bench_encode
+"""
+
+import io
+
+from PIL import features
+
+from captcha.image import ENCODER_PROFILES, ImageCaptcha, encode_image
+from captcha.instrument import clock
+
+QUANTIZE = [None, 64]
+CHARS = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+
+
+def formats():
+    rv = ['png', 'jpeg']
+    if features.check('webp'):
+        rv.append('webp')
+    return rv
+
+
+def sample_images(count=20, size=(160, 60), length=4):
+    captcha = ImageCaptcha(size[0], size[1], seed=0)
+    return [captcha.generate_image(''.join(
+        captcha.rng.choice(CHARS) for _ in range(length)))
+        for _ in range(count)]
+
+
+def bench_encode(images, number=3):
+    """Return the encode times of every image in seconds and the mean
+    payload size in bytes, by ``format/profile/colors`` name."""
+    results = {}
+    for format in formats():
+        for profile in [None] + sorted(ENCODER_PROFILES[format]):
+            for quantize in QUANTIZE:
+                if quantize and format == 'jpeg':
+                    # JPEG has no palette mode
+                    continue
+                samples = []
+                sizes = []
+                for _ in range(number):
+                    for im in images:
+                        out = io.BytesIO()
+                        start = clock()
+                        encode_image(im, out, format, profile, quantize)
+                        samples.append(clock() - start)
+                        sizes.append(out.tell())
+                name = '%s/%s/%s' % (format, profile or 'default',
+                                     quantize or 'rgb')
+                results[name] = (samples, sum(sizes) / float(len(sizes)))
+    return results
+
+
+def main():
+    results = bench_encode(sample_images())
+    print('%-26s %10s %10s' % ('format/profile/colors', 'encode ms', 'bytes'))
+    for name in sorted(results):
+        samples, size = results[name]
+        samples.sort()
+        print('%-26s %10.3f %10.0f' % (
+            name, samples[len(samples) // 2] * 1000, size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# coding: utf-8
+"""
+    Stress a thread-safe :class:`~captcha.image.ImageCaptcha` shared by
+    many threads, and report the throughput for each number of threads::
+
+        $ python -m benchmarks.bench_threads -n 200 -t 1 2 4 8
+
+    The throughput scales with the threads as far as Pillow releases the
+    GIL, in the resampling, filters and encoders, and as far as there
+    are CPUs.
+"""
+
+import sys
+import argparse
+import threading
+
+from captcha.image import ImageCaptcha
+from captcha.instrument import clock
+
+
+def stress(captcha, threads, count, format='png'):
+    """Generate ``count`` CAPTCHAs in each of ``threads`` threads at once.
+    Returns the number of CAPTCHAs per second."""
+    errors = []
+    start_gate = threading.Event()
+
+    def run():
+        start_gate.wait()
+        try:
+            for i in range(count):
+                captcha.generate('%04d' % i, format)
+        except Exception as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    start = clock()
+    start_gate.set()
+    for t in workers:
+        t.join()
+    seconds = clock() - start
+    if errors:
+        raise errors[0]
+    return threads * count / seconds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('-n', '--count', type=int, default=100,
+                        help='CAPTCHAs generated by each thread')
+    parser.add_argument('-t', '--threads', type=int, nargs='+',
+                        default=[1, 2, 4, 8])
+    parser.add_argument('-f', '--format', default='png')
+    args = parser.parse_args(argv)
+
+    captcha = ImageCaptcha(threadsafe=True)
+    # warm up the fonts and the glyph cache
+    captcha.generate('0123456789')
+    base = None
+    print('%8s %12s %8s' % ('threads', 'captchas/s', 'scaling'))
+    for threads in args.threads:
+        rate = stress(captcha, threads, args.count, args.format)
+        if base is None:
+            base = rate / threads
+        print('%8d %12.1f %7.2fx' % (threads, rate, rate / base))
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+# coding: utf-8
+"""
+    Compare two result files of :mod:`benchmarks.run`, and exit with an
+    error status if any stage got slower than the threshold::
+
+        $ python -m benchmarks.compare before.json after.json --threshold 10
+"""
+
+import sys
+import json
+import argparse
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def compare(before, after, threshold, metric='median_ms'):
+    rows = []
+    for name in sorted(set(before) & set(after)):
+        for stage in sorted(set(before[name]) & set(after[name])):
+            old = before[name][stage][metric]
+            new = after[name][stage][metric]
+            change = (new - old) / old * 100 if old else 0.0
+            rows.append((name, stage, old, new, change, change > threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('-t', '--threshold', type=float, default=10.0,
+                        help='slowdown in percent reported as a regression')
+    parser.add_argument('-m', '--metric', default='median_ms',
+                        choices=['median_ms', 'mean_ms', 'min_ms'])
+    parser.add_argument('-a', '--all', action='store_true',
+                        help='show every stage, not only the regressions')
+    args = parser.parse_args(argv)
+
+    rows = compare(load(args.before), load(args.after), args.threshold,
+                   args.metric)
+    regressions = [row for row in rows if row[-1]]
+    for name, stage, old, new, change, slower in rows:
+        if args.all or slower:
+            print('%-45s %-16s %10.3f %10.3f %+7.1f%%%s' % (
+                name, stage, old, new, change, '  SLOWER' if slower else ''))
+    print('%d stages compared, %d regressions' % (len(rows), len(regressions)))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,203 @@
+# coding: utf-8
+"""
+    Benchmark suite of the image and audio generation hot paths.
+
+    Every image configuration (size, text length, font, format) is timed
+    stage by stage, the audio primitives are timed one by one, every
+    encoder profile is timed with its payload size, and the image backends
+    are timed side by side. The results are
+    written as JSON, to be compared between commits with
+    :mod:`benchmarks.compare`::
+
+        $ python -m benchmarks.run -o before.json
+        $ git checkout feature
+        $ python -m benchmarks.run -o after.json
+        $ python -m benchmarks.compare before.json after.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+
+import PIL
+
+from benchmarks import bench_backends, bench_encode
+from captcha import audio
+from captcha.image import DEFAULT_FONTS, ImageCaptcha
+from captcha.instrument import Instrument
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SIZES = [(160, 60), (320, 120)]
+LENGTHS = [4, 8, 16]
+FONTS = [DEFAULT_FONTS[0], os.path.join(ROOT, 'tests', 'Vera.ttf')]
+FORMATS = ['png', 'jpeg']
+CHARS = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+
+
+class Timer(Instrument):
+    """Collect the durations of named stages, in seconds."""
+    def __init__(self):
+        super(Timer, self).__init__()
+        self.samples = {}
+
+    def stage(self, name, seconds, nbytes=None):
+        self.samples.setdefault(name, []).append(seconds)
+
+    def time(self, name, func, *args):
+        return self.measure(name, func, *args)
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    n = len(samples)
+    median = samples[n // 2] if n % 2 else (samples[n // 2 - 1] + samples[n // 2]) / 2
+    return {
+        'n': n,
+        'median_ms': median * 1000,
+        'mean_ms': sum(samples) / n * 1000,
+        'min_ms': samples[0] * 1000,
+    }
+
+
+def bench_image(iterations, sizes=SIZES, lengths=LENGTHS, fonts=FONTS,
+                formats=FORMATS):
+    results = {}
+    for width, height in sizes:
+        for font in fonts:
+            for length in lengths:
+                for format in formats:
+                    captcha = ImageCaptcha(width, height, fonts=[font],
+                                           seed=0)
+                    # warm up the fonts and the glyph cache
+                    captcha.generate(CHARS)
+                    # the stages are timed by the instrument of the captcha
+                    timer = Timer()
+                    captcha.instrument = timer
+                    for i in range(iterations):
+                        chars = ''.join(captcha.rng.choice(CHARS)
+                                        for _ in range(length))
+                        timer.time('total', captcha.generate, chars, format)
+
+                    name = 'image/%dx%d/%s/len%d/%s' % (
+                        width, height, os.path.basename(font), length, format)
+                    results[name] = dict(
+                        (stage, summarize(samples))
+                        for stage, samples in timer.samples.items())
+    return results
+
+
+def bench_audio(iterations, lengths=(4, 8)):
+    results = {}
+    body = audio.create_noise(audio.WAVE_SAMPLE_RATE * 5)
+    primitives = {
+        'change_speed': lambda: audio.change_speed(body, 1.13),
+        'change_sound': lambda: audio.change_sound(body, 0.87),
+        'mix_wave': lambda: audio.mix_wave(body, bytearray(body)),
+        'create_noise': lambda: audio.create_noise(len(body), 4),
+        'create_silence': lambda: audio.create_silence(len(body)),
+    }
+    timer = Timer()
+    for _ in range(iterations):
+        for name, func in primitives.items():
+            timer.time(name, func)
+    results['audio/primitives/%s' % audio.ENGINE] = dict(
+        (name, summarize(samples))
+        for name, samples in timer.samples.items())
+
+    captcha = audio.AudioCaptcha(seed=0)
+    captcha.load()
+    for length in lengths:
+        timer = Timer()
+        for _ in range(iterations):
+            chars = ''.join(captcha.rng.choice(captcha.choices)
+                            for _ in range(length))
+            timer.time('create_wave_body', captcha.create_wave_body, chars)
+        results['audio/generate/%s/len%d' % (audio.ENGINE, length)] = dict(
+            (name, summarize(samples))
+            for name, samples in timer.samples.items())
+    return results
+
+
+def bench_encoders(iterations):
+    results = {}
+    images = bench_encode.sample_images(count=max(1, iterations))
+    for name, (samples, size) in bench_encode.bench_encode(images).items():
+        stats = summarize(samples)
+        stats['bytes'] = size
+        results['encode/%s' % name] = {'encode': stats}
+    return results
+
+
+def bench_image_backends(iterations):
+    results = {}
+    for name, stages in bench_backends.bench_backends(iterations).items():
+        results['backend/%s' % name] = dict(
+            (stage, summarize(samples)) for stage, samples in stages.items())
+    return results
+
+
+def git_revision():
+    try:
+        out = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.decode('ascii').strip()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('-o', '--output', help='write the JSON results here')
+    parser.add_argument('-n', '--iterations', type=int, default=20)
+    parser.add_argument('--quick', action='store_true',
+                        help='only the smallest image configurations')
+    parser.add_argument('--no-image', action='store_true')
+    parser.add_argument('--no-audio', action='store_true')
+    parser.add_argument('--no-encode', action='store_true')
+    parser.add_argument('--no-backends', action='store_true')
+    args = parser.parse_args(argv)
+
+    results = {}
+    if not args.no_image:
+        if args.quick:
+            results.update(bench_image(args.iterations, SIZES[:1],
+                                       LENGTHS[:1], FONTS[:1], FORMATS[:1]))
+        else:
+            results.update(bench_image(args.iterations))
+    if not args.no_audio:
+        results.update(bench_audio(args.iterations))
+    if not args.no_encode:
+        results.update(bench_encoders(args.iterations))
+    if not args.no_backends:
+        results.update(bench_image_backends(args.iterations))
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'pillow': PIL.__version__,
+            'numpy': numpy.__version__ if numpy else None,
+            'iterations': args.iterations,
+        },
+        'results': results,
+    }
+    data = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(data)
+    else:
+        sys.stdout.write(data + '\n')
+
+
+if __name__ == '__main__':
+    main()
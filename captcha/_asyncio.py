@@ -0,0 +1,103 @@
+# coding: utf-8
+"""
+    captcha._asyncio
+    ~~~~~~~~~~~~~~~~
+
+    Run CAPTCHA generation from asyncio coroutines on an executor.
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ProcessPoolExecutor
+
+from captcha import batch
+
+
+def _call_seeded(captcha, seed, name, args):
+    # runs in a worker process, on a copy of the captcha
+    captcha.reseed(seed)
+    return getattr(captcha, name)(*args)
+
+
+def _call_worker(seed, name, args):
+    # runs in a worker process of the runner, on the captcha it was
+    # started with
+    return _call_seeded(batch._worker_captcha, seed, name, args)
+
+
+class AsyncRunner(object):
+    """Run the blocking methods of a captcha on an executor.
+
+    :param executor: a :class:`concurrent.futures.Executor`, the default
+                     executor of the event loop is used if it is ``None``.
+    :param max_concurrency: the maximum number of calls running at once,
+                            ``None`` for no limit.
+    :param processes: run the calls on a new pool of this many worker
+                      processes instead of ``executor``. Each worker gets a
+                      copy of ``captcha`` once, when it starts.
+    :param captcha: the captcha of the worker processes.
+    """
+    def __init__(self, executor=None, max_concurrency=None, processes=None,
+                 captcha=None):
+        self._owned = processes is not None
+        if self._owned:
+            if executor is not None:
+                raise ValueError('give an executor or a number of processes, '
+                                 'not both')
+            executor = ProcessPoolExecutor(
+                processes, initializer=batch._init_worker,
+                initargs=(captcha, None))
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+        self._processes = isinstance(executor, ProcessPoolExecutor)
+        self._loop = None
+        self._semaphore = None
+
+    def close(self):
+        """Shut down the worker processes started by this runner."""
+        if self._owned:
+            self.executor.shutdown(wait=False)
+
+    def _get_semaphore(self, loop):
+        if self.max_concurrency is None:
+            return None
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def call(self, captcha, name, *args):
+        """Call ``captcha.<name>(*args)`` on the executor.
+
+        In a worker process, the copy of the captcha is reseeded from the
+        generator of ``captcha`` so that every call differs. A worker
+        started by this runner has its copy already, otherwise a copy is
+        sent with every call.
+
+        With ``max_concurrency``, a call that is cancelled after it has
+        been submitted to the executor still counts until it finishes.
+        """
+        loop = asyncio.get_running_loop()
+        if self._owned:
+            seed = captcha.rng.getrandbits(64)
+            func = functools.partial(_call_worker, seed, name, args)
+        elif self._processes:
+            seed = captcha.rng.getrandbits(64)
+            func = functools.partial(_call_seeded, captcha, seed, name, args)
+        else:
+            func = functools.partial(getattr(captcha, name), *args)
+
+        semaphore = self._get_semaphore(loop)
+        if semaphore is None:
+            return await loop.run_in_executor(self.executor, func)
+
+        # a cancelled call keeps running on the executor, its slot is
+        # released only when it has finished
+        await semaphore.acquire()
+        try:
+            future = loop.run_in_executor(self.executor, func)
+        except BaseException:
+            semaphore.release()
+            raise
+        future.add_done_callback(lambda f: semaphore.release())
+        return await asyncio.shield(future)
@@ -0,0 +1,96 @@
+# coding: utf-8
+"""
+    captcha._audio_numpy
+    ~~~~~~~~~~~~~~~~~~~~
+
+    NumPy implementations of the wave primitives in :mod:`captcha.audio`.
+
+    Every function here produces exactly the same bytes as its pure Python
+    counterpart, including the random numbers it draws, so switching the
+    engine never changes the generated CAPTCHAs.
+"""
+
+import random
+
+import numpy
+
+from captcha.rng import randints
+
+
+def _as_array(body):
+    return numpy.frombuffer(bytes(body), dtype=numpy.uint8)
+
+
+def change_speed(body, speed=1):
+    """Change the voice speed of the wave body."""
+    if speed == 1:
+        return body
+
+    length = int(len(body) * speed)
+    src = _as_array(body)
+
+    # the pure Python version accumulates ``step += speed``, cumsum adds
+    # sequentially as well, which keeps the rounding identical
+    steps = numpy.empty(len(src) + 1, dtype=numpy.float64)
+    steps[0] = 0
+    numpy.cumsum(numpy.full(len(src), speed, dtype=numpy.float64),
+                 out=steps[1:])
+    bounds = numpy.minimum(steps.astype(numpy.int64), length)
+    counts = numpy.maximum(bounds[1:] - bounds[:-1], 0)
+
+    rv = numpy.zeros(length, dtype=numpy.uint8)
+    data = numpy.repeat(src, counts)
+    rv[:len(data)] = data
+    return bytearray(rv)
+
+
+def create_noise(length, level=4, rng=random):
+    """Create white noise for background"""
+    adjust = 128 - int(level / 2)
+    noise = randints(rng, length, 0, 256, numpy.int16)
+    noise %= level
+    noise += adjust
+    return bytearray(noise.astype(numpy.uint8))
+
+
+def create_silence(length):
+    """Create a piece of silence."""
+    return bytearray(numpy.full(length, 128, dtype=numpy.uint8))
+
+
+def change_sound(body, level=1):
+    if level == 1:
+        return body
+
+    v = _as_array(body).astype(numpy.int64)
+    rv = v.copy()
+
+    high = v > 128
+    scaled = (v[high] - 128) * level + 128
+    rv[high] = numpy.clip(numpy.trunc(scaled), 128, 255)
+
+    low = v < 128
+    scaled = 128 - (128 - v[low]) * level
+    rv[low] = numpy.clip(numpy.trunc(scaled), 0, 128)
+    return bytearray(rv.astype(numpy.uint8))
+
+
+def mix_wave(src, dst):
+    """Mix two wave body into one."""
+    if len(src) > len(dst):
+        # output should be longer
+        dst, src = src, dst
+
+    n = len(src)
+    if not n:
+        return dst
+
+    s = _as_array(src).astype(numpy.int64)
+    d = _as_array(dst[:n]).astype(numpy.int64)
+    product = s * d
+    quiet = (s < 128) & (d < 128)
+    loud = 2 * (s + d) - product / 128.0 - 256
+    mixed = numpy.where(quiet, product // 128, numpy.trunc(loud))
+    # mix in place, callers rely on ``dst`` being updated
+    dst[:n] = mixed.astype(numpy.uint8).tobytes()
+    return dst
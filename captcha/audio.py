@@ -15,13 +15,24 @@ import struct
 import random
 import operator
 
+from captcha.batch import derive_seed
+from captcha.cache import LRUCache
+from captcha.rng import _pickle_rng, _unpickle_rng
+from captcha.voicepack import VoicePack
+
 import sys
 if sys.version_info[0] != 2:
     import functools
     reduce = functools.reduce
+    basestring = str
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
-__all__ = ['AudioCaptcha']
+__all__ = ['AudioCaptcha', 'VariantCache']
 
 WAVE_SAMPLE_RATE = 8000  # HZ
 WAVE_HEADER = bytearray(
@@ -39,7 +50,7 @@ def _read_wave_file(filepath):
     return bytearray(data)
 
 
-def change_speed(body, speed=1):
+def _py_change_speed(body, speed=1):
     """Change the voice speed of the wave body."""
     if speed == 1:
         return body
@@ -57,13 +68,11 @@ def change_speed(body, speed=1):
     return rv
 
 
-def patch_wave_header(body):
-    """Patch header to the given wave body.
+def wave_header(length):
+    """Create the wave header of a wave body with the given length.
 
-    :param body: the wave content body, it should be bytearray.
+    :param length: the length of the wave content body.
     """
-    length = len(body)
-
     padded = length + length % 2
     total = WAVE_HEADER_LENGTH + padded
 
@@ -71,29 +80,38 @@ def patch_wave_header(body):
     # fill the total length position
     header[4:8] = bytearray(struct.pack('<I', total))
     header += bytearray(struct.pack('<I', length))
+    return header
+
 
-    data = header + body
+def patch_wave_header(body):
+    """Patch header to the given wave body.
+
+    :param body: the wave content body, it should be bytearray.
+    """
+    length = len(body)
+    data = wave_header(length)
+    data += body
 
     # the total length is even
-    if length != padded:
-        data = data + bytearray([0])
+    if length % 2:
+        data.append(0)
 
     return data
 
 
-def create_noise(length, level=4):
+def _py_create_noise(length, level=4, rng=random):
     """Create white noise for background"""
     noise = bytearray(length)
     adjust = 128 - int(level / 2)
     i = 0
     while i < length:
-        v = random.randint(0, 256)
+        v = rng.randint(0, 256)
         noise[i] = v % level + adjust
         i += 1
     return noise
 
 
-def create_silence(length):
+def _py_create_silence(length):
     """Create a piece of silence."""
     data = bytearray(length)
     i = 0
@@ -103,7 +121,7 @@ def create_silence(length):
     return data
 
 
-def change_sound(body, level=1):
+def _py_change_sound(body, level=1):
     if level == 1:
         return body
 
@@ -121,7 +139,7 @@ def change_sound(body, level=1):
     return body
 
 
-def mix_wave(src, dst):
+def _py_mix_wave(src, dst):
     """Mix two wave body into one."""
     if len(src) > len(dst):
         # output should be longer
@@ -136,11 +154,53 @@ def mix_wave(src, dst):
     return dst
 
 
+if numpy is not None:
+    from captcha import _audio_numpy as _engine
+else:
+    _engine = None
+
+#: Name of the engine the wave primitives run on, ``numpy`` or ``python``.
+ENGINE = 'numpy' if _engine else 'python'
+
+change_speed = _engine.change_speed if _engine else _py_change_speed
+create_noise = _engine.create_noise if _engine else _py_create_noise
+create_silence = _engine.create_silence if _engine else _py_create_silence
+change_sound = _engine.change_sound if _engine else _py_change_sound
+mix_wave = _engine.mix_wave if _engine else _py_mix_wave
+
+
 BEEP = _read_wave_file(os.path.join(DATA_DIR, 'beep.wav'))
 END_BEEP = change_speed(BEEP, 1.4)
 SILENCE = create_silence(int(WAVE_SAMPLE_RATE / 5))
 
 
+class VariantCache(LRUCache):
+    """A cache of voice samples changed in speed and sound level.
+
+    The speeds and levels of :class:`AudioCaptcha` are drawn from a grid
+    of a few dozen values, so a sample changed for a CAPTCHA is likely to
+    be needed again. A cache can be shared by many instances using the
+    same voice data::
+
+        cache = VariantCache(maxbytes=64 * 1024 * 1024)
+        captcha = AudioCaptcha(voicedir='/path/to/voices', variant_cache=cache)
+        captcha.prepare_variants()
+
+    :param maxbytes: the maximum size of the cached samples, 32 MB by
+                     default.
+    """
+    def __init__(self, maxbytes=32 * 1024 * 1024):
+        super(VariantCache, self).__init__(maxbytes=maxbytes, sizeof=len)
+
+
+#: the speed and level grids of the voices and of the background voices,
+#: in hundredths and tenths
+_TWIST_SPEEDS = range(90, 120)
+_TWIST_LEVELS = range(80, 120)
+_NOISE_SPEEDS = range(8, 16)
+_NOISE_LEVELS = range(2, 6)
+
+
 class AudioCaptcha(object):
     """Create an audio CAPTCHA.
 
@@ -165,87 +225,289 @@ class AudioCaptcha(object):
     You should always use your own voice library::
 
         captcha = AudioCaptcha(voicedir='/path/to/voices')
+
+    A large voice library is better compiled into a voice pack, which is
+    memory mapped and shared by every process, see
+    :mod:`captcha.voicepack`::
+
+        captcha = AudioCaptcha(voicepack='/path/to/voices.pack')
+
+    :param voicedir: the voice data library directory.
+    :param seed: seed the private random generator of this instance.
+    :param rng: a :class:`random.Random` instance to use instead, pass the
+                :mod:`random` module to share the global generator. A copy
+                in a worker process shares the generator of that process.
+    :param voicepack: a voice pack file path or
+                      :class:`~captcha.voicepack.VoicePack`, used instead
+                      of ``voicedir``.
+    :param variant_cache: a :class:`VariantCache` to keep the changed voice
+                          samples in, they are changed for every CAPTCHA
+                          by default.
+    :param noise_beds: the number of background noise beds made by
+                       :meth:`load`, see :meth:`prepare_noise_beds`. The
+                       background of every CAPTCHA is made from scratch
+                       by default.
+    :param noise_bed_seed: the seed of the noise beds, which are made from
+                           a generator of their own. It is derived from
+                           ``seed`` if it is given, and random otherwise.
     """
-    def __init__(self, voicedir=None):
+    def __init__(self, voicedir=None, seed=None, rng=None, voicepack=None,
+                 variant_cache=None, noise_beds=0, noise_bed_seed=None):
         if voicedir is None:
             voicedir = DATA_DIR
+        if isinstance(voicepack, basestring):
+            voicepack = VoicePack(voicepack)
 
         self._voicedir = voicedir
+        self._voicepack = voicepack
         self._cache = {}
         self._choices = []
+        self._rng = rng if rng is not None else random.Random(seed)
+        self._variant_cache = variant_cache
+        self._noise_bed_count = noise_beds
+        self._noise_bed_seconds = 30
+        self._noise_bed_options = (True, True, True)
+        if noise_bed_seed is None:
+            if seed is None:
+                # the beds must not be known to anyone else
+                noise_bed_seed = random.SystemRandom().getrandbits(64)
+            else:
+                # index -1 is never a sample of a batch
+                noise_bed_seed = derive_seed(seed, -1)
+        self._noise_bed_seed = noise_bed_seed
+        self._noise_beds = []
+        self._async_runner = None
+
+    def __getstate__(self):
+        # the executor of agenerate stays in this process, and the noise
+        # beds are made again from their seed
+        state = self.__dict__.copy()
+        state['_async_runner'] = None
+        state['_noise_beds'] = []
+        return _pickle_rng(state)
+
+    def __setstate__(self, state):
+        self.__dict__.update(_unpickle_rng(state))
+
+    def _prepare_worker(self):
+        # make the noise beds once when a worker starts
+        self.load()
+
+    @property
+    def rng(self):
+        """The random generator of this instance."""
+        return self._rng
+
+    def reseed(self, seed, index=None):
+        """Reseed the random generator of this instance.
+
+        With an ``index``, the generator is seeded for that sample of a
+        batch seeded with ``seed``, so the sample can be generated again
+        on its own, see :func:`captcha.batch.derive_seed`.
+
+        :param seed: the seed, an integer.
+        :param index: the index of a sample in a seeded batch.
+        """
+        if index is not None:
+            seed = derive_seed(seed, index)
+        self._rng.seed(seed)
 
     @property
     def choices(self):
         """Available choices for characters to be generated."""
         if self._choices:
             return self._choices
-        for n in os.listdir(self._voicedir):
+        if self._voicepack is not None:
+            self._choices = self._voicepack.choices
+            return self._choices
+        # sorted, the listing order depends on the file system and seeded
+        # CAPTCHAs must be the same everywhere
+        for n in sorted(os.listdir(self._voicedir)):
             if len(n) == 1 and os.path.isdir(os.path.join(self._voicedir, n)):
                 self._choices.append(n)
         return self._choices
 
-    def random(self, length=6):
+    def random(self, length=6, allow_repeat=False):
         """Generate a random string with the given length.
 
         :param length: the return string length.
+        :param allow_repeat: pick every character independently, so that
+                             characters may repeat and the string may be
+                             longer than :attr:`choices`.
         """
-        return random.sample(self.choices, length)
+        if allow_repeat:
+            choice = self._rng.choice
+            choices = self.choices
+            return [choice(choices) for _ in range(length)]
+        return self._rng.sample(self.choices, length)
 
     def load(self):
-        """Load voice data into memory."""
+        """Load voice data into memory, and make the noise beds."""
         for name in self.choices:
             self._load_data(name)
+        if self._noise_bed_count and not self._noise_beds:
+            self._make_noise_beds()
 
     def _load_data(self, name):
+        if self._voicepack is not None:
+            self._cache[name] = self._voicepack.samples(name)
+            return
         dirname = os.path.join(self._voicedir, name)
         data = []
-        for f in os.listdir(dirname):
+        for f in sorted(os.listdir(dirname)):
             filepath = os.path.join(dirname, f)
             if f.endswith('.wav') and os.path.isfile(filepath):
                 data.append(_read_wave_file(filepath))
         self._cache[name] = data
 
-    def _twist_pick(self, key):
-        voice = random.choice(self._cache[key])
-
-        # random change speed
-        speed = random.randrange(90, 120) / 100.0
+    @property
+    def variant_cache(self):
+        """The :class:`VariantCache` of this instance, or ``None``."""
+        return self._variant_cache
+
+    def _variant(self, key, index, speed, level, reverse=False):
+        cache = self._variant_cache
+        if cache is None:
+            return self._create_variant(key, index, speed, level, reverse)
+        variant = cache.get_or_create(
+            (key, index, speed, level, reverse),
+            lambda: bytes(
+                self._create_variant(key, index, speed, level, reverse)))
+        # the caller mixes into it
+        return bytearray(variant)
+
+    def _create_variant(self, key, index, speed, level, reverse):
+        # copied, voice pack samples are read-only and the samples of the
+        # cache must stay untouched
+        voice = bytearray(self._cache[key][index])
+        if reverse:
+            voice.reverse()
+            speed, level = speed / 10.0, level / 10.0
+        else:
+            speed, level = speed / 100.0, level / 100.0
         voice = change_speed(voice, speed)
+        return change_sound(voice, level)
 
-        # random change sound
-        level = random.randrange(80, 120) / 100.0
-        voice = change_sound(voice, level)
-        return voice
-
-    def _noise_pick(self):
-        key = random.choice(self.choices)
-        voice = random.choice(self._cache[key])
-        voice = copy.copy(voice)
-        voice.reverse()
-
-        speed = random.randrange(8, 16) / 10.0
-        voice = change_speed(voice, speed)
+    def _twist_pick(self, key):
+        rng = self._rng
+        index = rng.randrange(len(self._cache[key]))
+        # random change speed and sound
+        speed = rng.randrange(90, 120)
+        level = rng.randrange(80, 120)
+        return self._variant(key, index, speed, level)
+
+    def _noise_pick(self, rng):
+        key = rng.choice(self.choices)
+        index = rng.randrange(len(self._cache[key]))
+        speed = rng.randrange(8, 16)
+        level = rng.randrange(2, 6)
+        return self._variant(key, index, speed, level, reverse=True)
+
+    def prepare_variants(self, noise=True, voices=True):
+        """Fill the variant cache with every speed and level variant of
+        every sample, the background variants first, until the cache is
+        full. Returns the number of variants added.
+
+        :param noise: add the variants of the background voices.
+        :param voices: add the variants of the spoken voices.
+        """
+        cache = self._variant_cache
+        if cache is None:
+            raise ValueError('there is no variant cache')
+        if not self._cache:
+            self.load()
+        grids = []
+        if noise:
+            grids.append((_NOISE_SPEEDS, _NOISE_LEVELS, True))
+        if voices:
+            grids.append((_TWIST_SPEEDS, _TWIST_LEVELS, False))
+        count = 0
+        for speeds, levels, reverse in grids:
+            for key in self.choices:
+                for index in range(len(self._cache[key])):
+                    for speed in speeds:
+                        for level in levels:
+                            variant = bytes(self._create_variant(
+                                key, index, speed, level, reverse))
+                            if (cache.maxbytes is not None and
+                                    cache.nbytes + len(variant) > cache.maxbytes):
+                                return count
+                            cache.set((key, index, speed, level, reverse),
+                                      variant)
+                            count += 1
+        return count
+
+    def prepare_noise_beds(self, count=4, seconds=30, offset=True,
+                           gain=True, reverse=True):
+        """Make ``count`` long background noise beds, which the background
+        of every CAPTCHA is then cut from: a window of a random bed, at a
+        random offset, reversed half of the time, with a random gain of 0.8
+        to 1.2. A background longer than the beds is made from scratch.
+
+        The beds are made from a generator of their own, so they never
+        depend on the CAPTCHAs generated before, and a copy of this
+        instance in another process makes the same beds.
+
+        :param count: the number of beds, ``0`` to drop the beds.
+        :param seconds: the length of a bed.
+        :param offset: cut the window at a random offset, or at the start
+                       of the bed.
+        :param gain: apply a random gain to the window.
+        :param reverse: reverse the window half of the time.
+        """
+        self._noise_bed_count = count
+        self._noise_bed_seconds = seconds
+        self._noise_bed_options = (offset, gain, reverse)
+        self._make_noise_beds()
 
-        level = random.randrange(2, 6) / 10.0
-        voice = change_sound(voice, level)
-        return voice
+    def _make_noise_beds(self):
+        if not self._cache:
+            for name in self.choices:
+                self._load_data(name)
+        count, seconds = self._noise_bed_count, self._noise_bed_seconds
+        rng = random.Random(self._noise_bed_seed)
+        length = int(WAVE_SAMPLE_RATE * seconds)
+        self._noise_beds = [
+            bytes(self._create_background_noise(length, rng))
+            for _ in range(count)]
 
     def create_background_noise(self, length, chars):
-        noise = create_noise(length, 4)
+        if self._noise_bed_count and not self._noise_beds:
+            # a copy of this instance, the beds are not pickled
+            self._make_noise_beds()
+        beds = [bed for bed in self._noise_beds if len(bed) >= length]
+        if not beds:
+            return self._create_background_noise(length, self._rng)
+        rng = self._rng
+        offset, gain, reverse = self._noise_bed_options
+        bed = rng.choice(beds)
+        start = rng.randint(0, len(bed) - length) if offset else 0
+        noise = bytearray(bed[start:start + length])
+        if reverse and rng.random() < 0.5:
+            noise.reverse()
+        if gain:
+            noise = change_sound(noise, rng.randrange(80, 121) / 100.0)
+        return noise
+
+    def _create_background_noise(self, length, rng):
+        noise = create_noise(length, 4, rng)
         pos = 0
         while pos < length:
-            sound = self._noise_pick()
+            sound = self._noise_pick(rng)
             end = pos + len(sound) + 1
             noise[pos:end] = mix_wave(sound, noise[pos:end])
-            pos = end + random.randint(0, int(WAVE_SAMPLE_RATE / 10))
+            pos = end + rng.randint(0, int(WAVE_SAMPLE_RATE / 10))
         return noise
 
     def create_wave_body(self, chars):
+        return bytearray().join(self._create_wave_parts(chars))
+
+    def _create_wave_parts(self, chars):
         voices = []
         inters = []
         for key in chars:
             voices.append(self._twist_pick(key))
-            v = random.randint(WAVE_SAMPLE_RATE, WAVE_SAMPLE_RATE * 3)
+            v = self._rng.randint(WAVE_SAMPLE_RATE, WAVE_SAMPLE_RATE * 3)
             inters.append(v)
 
         durations = map(lambda a: len(a), voices)
@@ -259,7 +521,7 @@ class AudioCaptcha(object):
             bg[pos:end] = mix_wave(v, bg[pos:end])
             pos = end + inters[i]
 
-        return BEEP + SILENCE + BEEP + SILENCE + BEEP + bg + END_BEEP
+        return [BEEP, SILENCE, BEEP, SILENCE, BEEP, bg, END_BEEP]
 
     def generate(self, chars):
         """Generate audio CAPTCHA data. The return data is a bytearray.
@@ -268,15 +530,90 @@ class AudioCaptcha(object):
         """
         if not self._cache:
             self.load()
-        body = self.create_wave_body(chars)
-        return patch_wave_header(body)
+        parts = self._create_wave_parts(chars)
+        length = sum(len(part) for part in parts)
+        data = wave_header(length)
+        for part in parts:
+            data += part
+        if length % 2:
+            data.append(0)
+        return data
+
+    def configure_async(self, executor=None, max_concurrency=None,
+                        processes=None):
+        """Configure how :meth:`agenerate` runs.
+
+        With ``processes``, the CAPTCHAs are generated by that many worker
+        processes, each getting a copy of this instance once, as it is
+        now. With a :class:`~concurrent.futures.ProcessPoolExecutor`,
+        every call sends a copy of this instance to a worker process.
+
+        :param executor: a :class:`concurrent.futures.Executor`, the
+                         default executor of the event loop if ``None``.
+        :param max_concurrency: the maximum number of CAPTCHAs generated at
+                                once, ``None`` for no limit.
+        :param processes: the number of worker processes, instead of
+                          ``executor``.
+        """
+        from captcha._asyncio import AsyncRunner
+        if self._async_runner is not None:
+            self._async_runner.close()
+        self._async_runner = None
+        self._async_runner = AsyncRunner(executor, max_concurrency,
+                                         processes, self)
+
+    def agenerate(self, chars):
+        """Generate audio CAPTCHA data on an executor, without blocking
+        the event loop. This is a coroutine::
+
+            data = await captcha.agenerate('1234')
+
+        Cancelling it cancels the call if it has not started yet, a
+        running call is finished and its result is dropped.
+
+        :param chars: text to be generated.
+        """
+        if self._async_runner is None:
+            self.configure_async()
+        return self._async_runner.call(self, 'generate', chars)
+
+    def stream(self, chars, chunk_size=8192):
+        """Generate audio CAPTCHA data as an iterator of bytes chunks.
+
+        The wave header comes first, then the body in chunks of at most
+        ``chunk_size`` bytes, so the whole payload is never copied. It can
+        be returned as a WSGI response body directly.
+
+        :param chars: text to be generated.
+        :param chunk_size: the maximum size of a chunk.
+        """
+        if not self._cache:
+            self.load()
+        parts = self._create_wave_parts(chars)
+        length = sum(len(part) for part in parts)
+        yield bytes(wave_header(length))
+        for part in parts:
+            view = memoryview(part)
+            for i in range(0, len(view), chunk_size):
+                yield view[i:i + chunk_size].tobytes()
+        if length % 2:
+            yield b'\x00'
 
     def write(self, chars, output):
-        """Generate and write audio CAPTCHA data to the output.
+        """Generate and write audio CAPTCHA data to the output. Returns the
+        number of bytes written.
 
         :param chars: text to be generated.
-        :param output: output destionation.
+        :param output: output destionation, a file path or a file object.
         """
-        data = self.generate(chars)
+        if hasattr(output, 'write'):
+            return self._write_stream(chars, output)
         with open(output, 'wb') as f:
-            return f.write(data)
+            return self._write_stream(chars, f)
+
+    def _write_stream(self, chars, f):
+        size = 0
+        for chunk in self.stream(chars):
+            f.write(chunk)
+            size += len(chunk)
+        return size
@@ -0,0 +1,113 @@
+# coding: utf-8
+"""
+    captcha.batch
+    ~~~~~~~~~~~~~
+
+    Generate CAPTCHAs in bulk on a pool of worker processes.
+
+    The captcha instance is sent to every worker once, when the worker
+    starts, so fonts and voice data are loaded once per process. Results
+    are streamed back in input order, with only a bounded number of tasks
+    in flight at any time.
+"""
+
+import binascii
+import collections
+import hashlib
+import itertools
+import multiprocessing
+import random
+
+__all__ = ['derive_seed', 'imap_batch']
+
+
+def derive_seed(seed, index):
+    """Derive the seed of the ``index``-th sample of a batch.
+
+    The result only depends on ``seed`` and ``index``, so any sample of a
+    seeded batch can be regenerated on its own.
+
+    :param seed: the seed of the whole batch, an integer.
+    :param index: the position of the sample in the batch.
+    """
+    key = ('%d:%d' % (seed, index)).encode('ascii')
+    digest = hashlib.sha256(key).digest()
+    return int(binascii.hexlify(digest[:8]), 16)
+
+
+_worker_captcha = None
+_worker_seed = None
+
+
+def _init_worker(captcha, seed):
+    global _worker_captcha, _worker_seed
+    _worker_captcha = captcha
+    _worker_seed = seed
+    # forked workers inherit the random state of the parent, make sure
+    # they don't produce the same CAPTCHAs when no seed is given
+    random.seed()
+    getattr(captcha, 'rng', random).seed()
+    prepare = getattr(captcha, '_prepare_worker', None)
+    if prepare is not None:
+        prepare()
+
+
+def _run_chunk(func, chunk, captcha=None, seed=None):
+    if captcha is None:
+        captcha, seed = _worker_captcha, _worker_seed
+    rv = []
+    for index, args in chunk:
+        if seed is not None:
+            getattr(captcha, 'rng', random).seed(derive_seed(seed, index))
+        rv.append(func(captcha, *args))
+    return rv
+
+
+def _chunks(tasks, chunksize):
+    tasks = enumerate(tasks)
+    while True:
+        chunk = list(itertools.islice(tasks, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def imap_batch(captcha, func, tasks, workers=None, seed=None, chunksize=8):
+    """Run ``func(captcha, *args)`` for every ``args`` in ``tasks``.
+
+    Results are yielded in the order of ``tasks``. ``tasks`` is consumed
+    lazily, at most ``4 * workers`` chunks are in flight at once.
+
+    :param captcha: the captcha instance, it must be picklable.
+    :param func: a module level function, it must be picklable.
+    :param tasks: an iterable of argument tuples.
+    :param workers: number of worker processes, defaults to the number of
+                    CPUs. With ``0`` everything runs in this process.
+    :param seed: seed the random generator of ``captcha`` before each
+                 task, derived from this seed and the task index.
+    :param chunksize: number of tasks sent to a worker at once.
+    """
+    if workers == 0:
+        for chunk in _chunks(tasks, chunksize):
+            for result in _run_chunk(func, chunk, captcha, seed):
+                yield result
+        return
+
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+
+    pool = multiprocessing.Pool(workers, _init_worker, (captcha, seed))
+    try:
+        pending = collections.deque()
+        for chunk in _chunks(tasks, chunksize):
+            pending.append(pool.apply_async(_run_chunk, (func, chunk)))
+            if len(pending) >= 4 * workers:
+                for result in pending.popleft().get():
+                    yield result
+        while pending:
+            for result in pending.popleft().get():
+                yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
@@ -0,0 +1,141 @@
+# coding: utf-8
+"""
+    captcha.cache
+    ~~~~~~~~~~~~~
+
+    A small thread-safe LRU cache, bounded by entries and by bytes.
+"""
+
+import collections
+import threading
+
+__all__ = ['LRUCache']
+
+
+def _no_size(value):
+    return 0
+
+
+#: the default of a limit that is not changed
+_KEEP = object()
+
+
+class LRUCache(object):
+    """A least recently used cache with hit and miss counters.
+
+    The cache can be bounded by the number of entries, by the total size of
+    the values, or both. The size of a value is measured by ``sizeof``::
+
+        cache = LRUCache(maxbytes=8 * 1024 * 1024, sizeof=len)
+
+    :param maxsize: the maximum number of entries, ``None`` for no limit.
+    :param maxbytes: the maximum total size of the values, ``None`` for no
+                     limit.
+    :param sizeof: a function returning the size of a value in bytes.
+    """
+    def __init__(self, maxsize=None, maxbytes=None, sizeof=None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self._sizeof = sizeof or _no_size
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __getstate__(self):
+        # entries and the lock stay in this process, a copy starts empty
+        state = self.__dict__.copy()
+        state['_data'] = collections.OrderedDict()
+        state['nbytes'] = 0
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """Get the value of ``key`` and mark it as recently used."""
+        with self._lock:
+            try:
+                value, size = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = (value, size)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Set the value of ``key``, evicting the least recently used
+        entries when the cache is full. A value larger than ``maxbytes`` is
+        not cached at all.
+        """
+        size = self._sizeof(value)
+        if self.maxbytes is not None and size > self.maxbytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+            self._data[key] = (value, size)
+            self.nbytes += size
+            self._evict()
+
+    def get_or_create(self, key, create):
+        """Get the value of ``key``, or create it with ``create()`` and
+        cache it on a miss.
+        """
+        value = self.get(key)
+        if value is None:
+            value = create()
+            self.set(key, value)
+        return value
+
+    def resize(self, maxsize=_KEEP, maxbytes=_KEEP):
+        """Change the limits of the cache, evicting entries if needed. A
+        limit that is not given is kept, pass ``None`` to remove it.
+        """
+        with self._lock:
+            if maxsize is not _KEEP:
+                self.maxsize = maxsize
+            if maxbytes is not _KEEP:
+                self.maxbytes = maxbytes
+            self._evict()
+
+    def _evict(self):
+        while self._data and (
+                (self.maxsize is not None and
+                 len(self._data) > self.maxsize) or
+                (self.maxbytes is not None and
+                 self.nbytes > self.maxbytes)):
+            _, (_, size) = self._data.popitem(last=False)
+            self.nbytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        """Remove every entry, the counters are kept."""
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """Return the counters and the current usage as a dict."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._data),
+                'nbytes': self.nbytes,
+                'maxsize': self.maxsize,
+                'maxbytes': self.maxbytes,
+            }
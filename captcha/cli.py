@@ -0,0 +1,221 @@
+# coding: utf-8
+"""
+    captcha.cli
+    ~~~~~~~~~~~
+
+    The ``captcha-gen`` command, generate image or audio CAPTCHAs in bulk::
+
+        $ captcha-gen -n 100000 --length 4-6 --size 160x60 -j 8 output/
+        $ captcha-gen --audio -n 1000 --voicepack voices.pack output/
+
+    The settings of a run are saved in ``captcha-gen.json`` in the output
+    directory, an interrupted run is finished with ``--resume``::
+
+        $ captcha-gen --resume output/
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import string
+import argparse
+
+from captcha.batch import imap_batch
+from captcha.dataset import write_dataset
+from captcha.text import UniformText
+
+__all__ = ['main']
+
+MANIFEST = 'captcha-gen.json'
+DEFAULT_CHARSET = string.digits + string.ascii_letters
+
+#: the arguments saved in the manifest, they are reused by ``--resume``
+_SETTINGS = ['audio', 'count', 'charset', 'length', 'size', 'fonts',
+             'font_sizes', 'voicedir', 'voicepack', 'seed', 'format',
+             'layout', 'shard_size']
+
+
+def _length(value):
+    low, _, high = value.partition('-')
+    try:
+        low = int(low)
+        high = int(high) if high else low
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected N or MIN-MAX')
+    if not 0 < low <= high:
+        raise argparse.ArgumentTypeError('expected 0 < MIN <= MAX')
+    return [low, high]
+
+
+def _size(value):
+    try:
+        width, height = [int(n) for n in value.lower().split('x')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected WIDTHxHEIGHT')
+    return [width, height]
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(
+        prog='captcha-gen',
+        description='Generate image or audio CAPTCHAs in bulk.')
+    parser.add_argument('output', help='the output directory')
+    parser.add_argument('--audio', action='store_true',
+                        help='generate audio CAPTCHAs instead of images')
+    parser.add_argument('-n', '--count', type=int, default=1000,
+                        help='the number of CAPTCHAs (default: 1000)')
+    parser.add_argument('-c', '--charset', default=None,
+                        help='the characters of the texts (default: '
+                             'letters and digits, or the voice characters)')
+    parser.add_argument('-l', '--length', type=_length, default=[4, 4],
+                        metavar='N[-M]',
+                        help='the text length, or a range (default: 4)')
+    parser.add_argument('-s', '--size', type=_size, default=[160, 60],
+                        metavar='WxH', help='the image size (default: 160x60)')
+    parser.add_argument('--font', dest='fonts', action='append',
+                        metavar='PATH', help='a font file, can be repeated')
+    parser.add_argument('--font-size', dest='font_sizes', type=int,
+                        action='append', metavar='N',
+                        help='a font size, can be repeated')
+    parser.add_argument('--voicedir', help='the voice data library directory')
+    parser.add_argument('--voicepack', help='a voice pack file')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='the number of worker processes (default: one '
+                             'per CPU, 0 to run in this process)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='the seed of the run (default: random)')
+    parser.add_argument('-f', '--format', default='png',
+                        help='the image file format (default: png)')
+    parser.add_argument('--layout', choices=['files', 'shards'],
+                        default='files',
+                        help='one file per CAPTCHA named INDEX_TEXT, or '
+                             'shards read by captcha.dataset.Dataset '
+                             '(default: files)')
+    parser.add_argument('--shard-size', type=int, default=10000,
+                        help='the number of CAPTCHAs of a shard')
+    parser.add_argument('--resume', action='store_true',
+                        help='finish an interrupted run, with its settings')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='do not report the progress')
+    return parser
+
+
+def make_captcha(args):
+    if args.audio:
+        from captcha.audio import AudioCaptcha
+        return AudioCaptcha(voicedir=args.voicedir, voicepack=args.voicepack)
+    from captcha.image import ImageCaptcha
+    width, height = args.size
+    return ImageCaptcha(width, height, fonts=args.fonts,
+                        font_sizes=args.font_sizes)
+
+
+def make_texts(args, charset):
+    return UniformText(charset, length=tuple(args.length), count=args.count,
+                       seed=args.seed)
+
+
+def _write_sample(captcha, index, chars, path, format, seed):
+    # written under a temporary name, an existing file is complete
+    captcha.reseed(seed, index)
+    if format is None:
+        captcha.write(chars, path + '.tmp')
+    else:
+        captcha.write(chars, path + '.tmp', format=format)
+    os.rename(path + '.tmp', path)
+
+
+class Progress(object):
+    """Report the number of CAPTCHAs generated and the throughput."""
+    def __init__(self, total, quiet=False, interval=1.0):
+        self.total = total
+        self.quiet = quiet
+        self.interval = interval
+        self.skipped = 0
+        self.done = 0
+        self.start = self.shown = time.time()
+
+    def rate(self):
+        elapsed = time.time() - self.start
+        return self.done / elapsed if elapsed else 0.0
+
+    def add(self, n=1):
+        self.done += n
+        now = time.time()
+        if not self.quiet and now - self.shown >= self.interval:
+            self.shown = now
+            sys.stderr.write('%d/%d  %.1f/sec\n' % (
+                self.skipped + self.done, self.total, self.rate()))
+
+    def finish(self):
+        if not self.quiet:
+            sys.stderr.write('%d generated, %d already done, %.1f/sec\n' % (
+                self.done, self.skipped, self.rate()))
+
+
+def write_files(captcha, texts, args, format, progress):
+    extension = 'wav' if format is None else format.lower()
+
+    def tasks():
+        for index, chars in enumerate(texts):
+            name = '%08d_%s.%s' % (index, chars, extension)
+            path = os.path.join(args.output, name)
+            if os.path.exists(path):
+                progress.skipped += 1
+            else:
+                yield (index, chars, path, format, args.seed)
+
+    for _ in imap_batch(captcha, _write_sample, tasks(), workers=args.workers):
+        progress.add()
+
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    manifest = os.path.join(args.output, MANIFEST)
+    if args.resume:
+        if not os.path.exists(manifest):
+            sys.stderr.write('captcha-gen: %s not found\n' % manifest)
+            return 2
+        with open(manifest) as f:
+            settings = json.load(f)
+        for name in _SETTINGS:
+            setattr(args, name, settings[name])
+    elif os.path.exists(manifest):
+        sys.stderr.write('captcha-gen: %s exists, use --resume to finish '
+                         'that run\n' % manifest)
+        return 2
+    else:
+        if args.seed is None:
+            args.seed = random.SystemRandom().getrandbits(32)
+        if not os.path.isdir(args.output):
+            os.makedirs(args.output)
+        with open(manifest, 'w') as f:
+            json.dump(dict((name, getattr(args, name)) for name in _SETTINGS),
+                      f, indent=2, sort_keys=True)
+
+    captcha = make_captcha(args)
+    if args.audio:
+        format = None
+        charset = args.charset or ''.join(captcha.choices)
+    else:
+        format = args.format
+        charset = args.charset or DEFAULT_CHARSET
+    texts = make_texts(args, charset)
+
+    progress = Progress(len(texts), args.quiet)
+    if args.layout == 'shards':
+        done = write_dataset(captcha, texts, args.output, args.shard_size,
+                             workers=args.workers, format=format,
+                             seed=args.seed)
+        progress.skipped = len(texts) - done
+        progress.add(done)
+    else:
+        write_files(captcha, texts, args, format, progress)
+    progress.finish()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
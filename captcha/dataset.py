@@ -0,0 +1,211 @@
+# coding: utf-8
+"""
+    captcha.dataset
+    ~~~~~~~~~~~~~~~
+
+    Write large CAPTCHA datasets as a few shard files, and read them back
+    with random access.
+
+    Every shard holds the encoded images of up to ``shard_size`` samples
+    back to back in a ``.data`` file, and an ``.index`` file of the offset,
+    length and label of each sample. The shards are written by a pool of
+    worker processes. A shard is complete once its index exists, so an
+    interrupted run is resumed by running it again::
+
+        texts = [random_text() for _ in range(1000000)]
+        write_dataset(ImageCaptcha(), texts, 'train', seed=1)
+
+        dataset = Dataset('train')
+        label, data = dataset[123456]
+"""
+
+import os
+import io
+import mmap
+import bisect
+import struct
+import itertools
+
+from PIL import Image
+
+from captcha.batch import imap_batch
+
+__all__ = ['write_dataset', 'Dataset']
+
+MAGIC = b'CADS'
+VERSION = 1
+_HEADER = struct.Struct('<4sII')
+_ENTRY = struct.Struct('<QIH')
+
+
+def _shard_path(directory, shard):
+    return os.path.join(directory, 'shard-%05d' % shard)
+
+
+def _replace(src, dst):
+    # a shard left over from an interrupted run is overwritten, which
+    # os.rename does not do on Windows
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:
+        if os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
+def _write_shard(captcha, directory, shard, start, texts, format, seed):
+    path = _shard_path(directory, shard)
+    entries = []
+    offset = 0
+    with open(path + '.data.tmp', 'wb') as f:
+        for index, chars in enumerate(texts, start):
+            if seed is not None:
+                captcha.reseed(seed, index)
+            if format is None:
+                captcha.write(chars, f)
+            else:
+                captcha.write(chars, f, format=format)
+            length = f.tell() - offset
+            label = chars.encode('utf-8')
+            entries.append(_ENTRY.pack(offset, length, len(label)) + label)
+            offset += length
+    _replace(path + '.data.tmp', path + '.data')
+
+    # the index is written last, it marks the shard as complete
+    with open(path + '.index.tmp', 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(entries)))
+        f.write(b''.join(entries))
+    _replace(path + '.index.tmp', path + '.index')
+    return len(entries)
+
+
+def write_dataset(captcha, texts, directory, shard_size=10000, workers=None,
+                  format='png', seed=None):
+    """Generate the CAPTCHAs of ``texts`` into the shards of
+    ``directory``. Complete shards of an earlier run are kept, so that an
+    interrupted run can be resumed. Returns the number of samples written
+    by this run.
+
+    :param captcha: an :class:`~captcha.image.ImageCaptcha`, or an
+                    :class:`~captcha.audio.AudioCaptcha`.
+    :param texts: an iterable of texts, the labels of the samples, such as
+                  a :mod:`captcha.text` source. It is consumed lazily. A
+                  resumed run must be given the same texts.
+    :param directory: the dataset directory, it is created if needed.
+    :param shard_size: the number of samples of a shard.
+    :param workers: number of worker processes, defaults to the number
+                    of CPUs. Use ``0`` to generate in this process.
+    :param format: image file format, ``None`` for an
+                   :class:`~captcha.audio.AudioCaptcha`.
+    :param seed: make the dataset reproducible, each sample is seeded from
+                 ``seed`` and its index. A resumed run needs a seed to
+                 write the same samples as an uninterrupted one.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    tasks = _shard_tasks(texts, directory, shard_size, format, seed)
+    count = 0
+    for n in imap_batch(captcha, _write_shard, tasks, workers=workers,
+                        chunksize=1):
+        count += n
+    return count
+
+
+def _shard_tasks(texts, directory, shard_size, format, seed):
+    # the texts are consumed one shard at a time, as the pool needs them
+    texts = iter(texts)
+    for shard in itertools.count():
+        chunk = list(itertools.islice(texts, shard_size))
+        if not chunk:
+            return
+        if os.path.exists(_shard_path(directory, shard) + '.index'):
+            continue
+        yield (directory, shard, shard * shard_size, chunk, format, seed)
+
+
+class _Shard(object):
+    def __init__(self, path):
+        with open(path + '.index', 'rb') as f:
+            index = f.read()
+        magic, version, count = _HEADER.unpack_from(index, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%r is not a dataset shard' % path)
+
+        self.entries = []
+        self.labels = []
+        pos = _HEADER.size
+        for _ in range(count):
+            offset, length, size = _ENTRY.unpack_from(index, pos)
+            pos += _ENTRY.size
+            self.entries.append((offset, length))
+            self.labels.append(index[pos:pos + size].decode('utf-8'))
+            pos += size
+
+        self._mmap = None
+        if count:
+            with open(path + '.data', 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def data(self, i):
+        offset, length = self.entries[i]
+        return memoryview(self._mmap)[offset:offset + length]
+
+
+class Dataset(object):
+    """A dataset written by :func:`write_dataset`.
+
+    The samples are read-only memoryviews of the memory mapped shards,
+    only the indexes are read when the dataset is opened. Incomplete
+    shards are left out::
+
+        dataset = Dataset('train')
+        for i in order:
+            image = dataset.image(i)
+            label = dataset.labels[i]
+
+    :param directory: the dataset directory.
+    """
+    def __init__(self, directory):
+        self._open(directory)
+
+    def __getstate__(self):
+        return {'directory': self.directory}
+
+    def __setstate__(self, state):
+        self._open(state['directory'])
+
+    def _open(self, directory):
+        self.directory = directory
+        names = sorted(f[:-len('.index')] for f in os.listdir(directory)
+                       if f.startswith('shard-') and f.endswith('.index'))
+        self._shards = [_Shard(os.path.join(directory, n)) for n in names]
+        self._starts = []
+        self.labels = []
+        for shard in self._shards:
+            self._starts.append(len(self.labels))
+            self.labels.extend(shard.labels)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, i):
+        """Return the label and the encoded image of the ``i``-th sample."""
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('dataset index out of range')
+        n = bisect.bisect_right(self._starts, i) - 1
+        shard = self._shards[n]
+        j = i - self._starts[n]
+        return shard.labels[j], shard.data(j)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def image(self, i):
+        """Return the ``i``-th sample decoded as a :class:`PIL.Image.Image`."""
+        return Image.open(io.BytesIO(self[i][1]))
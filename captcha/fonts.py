@@ -0,0 +1,175 @@
+# coding: utf-8
+"""
+    captcha.fonts
+    ~~~~~~~~~~~~~
+
+    A process-wide cache of loaded TrueType fonts, and of the metrics of
+    their glyphs.
+
+    Every :class:`~captcha.image.ImageCaptcha` loads its fonts through
+    :data:`font_cache` by default, so instances using the same font file
+    and size share one loaded face. A face is loaded the first time it is
+    picked, and the least recently used faces are dropped when the cache
+    is full::
+
+        from captcha.fonts import font_cache
+        font_cache.resize(maxsize=16)
+
+    The size and the ink box of a glyph are measured once per font and
+    kept in :data:`font_metrics`, which can be saved to a file so that
+    new processes do not measure again::
+
+        font_metrics.prepare(font, string.ascii_letters)
+        font_metrics.save('metrics.json')
+
+        font_metrics.load('metrics.json')
+"""
+
+import json
+import threading
+
+import PIL
+from PIL import Image
+from PIL.ImageDraw import Draw
+from PIL.ImageFont import truetype
+
+from captcha.cache import LRUCache
+
+__all__ = ['FontCache', 'font_cache', 'get_font', 'FontMetrics',
+           'font_metrics', 'render_lock']
+
+#: held while a font renders or measures text. The fonts are shared by
+#: every thread, and a FreeType face must not be used by two threads at
+#: once.
+render_lock = threading.Lock()
+
+
+class FontCache(LRUCache):
+    """A cache of loaded fonts, keyed by ``(path, size)``.
+
+    :param maxsize: the maximum number of loaded faces, ``None`` for no
+                    limit.
+    """
+    def __init__(self, maxsize=64):
+        super(FontCache, self).__init__(maxsize)
+
+    def get_font(self, path, size):
+        """Get the font of ``path`` at ``size``, loading it on a miss."""
+        return self.get_or_create((path, size), lambda: truetype(path, size))
+
+
+#: the cache shared by the whole process
+font_cache = FontCache()
+
+
+def get_font(path, size):
+    """Get a font from the shared :data:`font_cache`."""
+    return font_cache.get_font(path, size)
+
+
+def _measure(font, c):
+    with render_lock:
+        return _measure_unlocked(font, c)
+
+
+def _measure_unlocked(font, c):
+    if hasattr(font, 'getbbox'):
+        left, top, right, bottom = font.getbbox(c)
+        width = right - min(0, left)
+        height = bottom - min(0, top)
+    else:
+        width, height = font.getsize(c)
+    # the ink is measured with a margin, glyphs may draw outside of
+    # their box
+    pad = max(width, height, 1)
+    im = Image.new('L', (width + 2 * pad, height + 2 * pad), 0)
+    Draw(im).text((pad, pad), c, font=font, fill=255)
+    ink = im.getbbox()
+    if ink is not None:
+        ink = tuple(n - pad for n in ink)
+    return width, height, ink
+
+
+class FontMetrics(object):
+    """The metrics of glyphs, measured the first time they are asked for.
+
+    The metrics of a character are ``(width, height, ink)``: the size of
+    the text box the character is drawn in, as ``textsize`` returned it,
+    and the box of the pixels it draws, relative to the drawing position,
+    or ``None`` for a blank glyph.
+
+    The metrics depend on the version of Pillow and FreeType, a file saved
+    with another version of Pillow is not loaded.
+    """
+    def __init__(self):
+        self._fonts = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _table(self, font):
+        key = (font.path, font.size, font.index)
+        table = self._fonts.get(key)
+        if table is None:
+            with self._lock:
+                table = self._fonts.setdefault(key, {})
+        return table
+
+    def get(self, font, c):
+        """Return the metrics of the character ``c`` in ``font``."""
+        table = self._table(font)
+        metrics = table.get(c)
+        if metrics is None:
+            metrics = table[c] = _measure(font, c)
+        return metrics
+
+    def prepare(self, font, chars):
+        """Measure every character of ``chars`` in ``font``."""
+        for c in chars:
+            self.get(font, c)
+
+    def save(self, path):
+        """Save every measured metrics to the JSON file ``path``."""
+        fonts = []
+        for (name, size, index), table in list(self._fonts.items()):
+            if not isinstance(name, str):
+                continue
+            fonts.append({
+                'path': name, 'size': size, 'index': index,
+                'glyphs': dict(
+                    (c, [w, h, ink]) for c, (w, h, ink) in table.items()),
+            })
+        with open(path, 'w') as f:
+            json.dump({'pillow': PIL.__version__, 'fonts': fonts}, f)
+
+    def load(self, path):
+        """Load the metrics saved in ``path``. Returns ``False`` if it was
+        saved with another version of Pillow, and nothing is loaded.
+        """
+        with open(path) as f:
+            data = json.load(f)
+        if data.get('pillow') != PIL.__version__:
+            return False
+        for item in data['fonts']:
+            key = (item['path'], item['size'], item['index'])
+            with self._lock:
+                table = self._fonts.setdefault(key, {})
+            for c, (w, h, ink) in item['glyphs'].items():
+                table[c] = (w, h, tuple(ink) if ink is not None else None)
+        return True
+
+    def clear(self):
+        """Drop every measured metrics."""
+        with self._lock:
+            self._fonts = {}
+
+
+#: the metrics shared by the whole process
+font_metrics = FontMetrics()
@@ -7,11 +7,13 @@
 """
 
 import os
+import copy
+import math
 import random
+import binascii
 from PIL import Image
 from PIL import ImageFilter
 from PIL.ImageDraw import Draw
-from PIL.ImageFont import truetype
 try:
     from cStringIO import StringIO as BytesIO
 except ImportError:
@@ -20,7 +22,16 @@ try:
     from wheezy.captcha import image as wheezy_captcha
 except ImportError:
     wheezy_captcha = None
-import math
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from captcha.batch import derive_seed, imap_batch
+from captcha.cache import LRUCache
+from captcha.fonts import font_cache as shared_font_cache, font_metrics, \
+    render_lock
+from captcha.rng import ThreadLocalRandom, _pickle_rng, _unpickle_rng
 
 DATA_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'data')
 DEFAULT_FONTS = [os.path.join(DATA_DIR, 'DroidSansMono.ttf')]
@@ -35,56 +46,435 @@ table  =  []
 for  i  in  range( 256 ):
     table.append( i * 1.97 )
 
+#: the save options of each encoder profile, per image file format
+ENCODER_PROFILES = {
+    'png': {
+        'fast': {'compress_level': 1},
+        'balanced': {'compress_level': 6},
+        'small': {'compress_level': 9, 'optimize': True},
+    },
+    'jpeg': {
+        'fast': {'quality': 75},
+        'balanced': {'quality': 85, 'optimize': True},
+        'small': {'quality': 70, 'optimize': True, 'progressive': True},
+    },
+    'webp': {
+        'fast': {'quality': 80, 'method': 0},
+        'balanced': {'quality': 80, 'method': 4},
+        'small': {'quality': 70, 'method': 6},
+    },
+}
+
+
+#: the image file formats without a palette mode
+_NO_PALETTE = ('jpeg',)
+
+
+def _format_name(format):
+    format = format.lower()
+    if format == 'jpg':
+        return 'jpeg'
+    return format
+
+
+def _save_options(format, profile):
+    if profile is None:
+        return {}
+    if isinstance(profile, dict):
+        return profile
+    format = _format_name(format)
+    try:
+        return ENCODER_PROFILES[format][profile]
+    except KeyError:
+        raise ValueError('no %r encoder profile for %s' % (profile, format))
+
+
+def encode_image(im, output, format='png', profile=None, quantize=None):
+    """Save an image with an encoder profile.
+
+    :param im: the :class:`PIL.Image.Image` to save.
+    :param output: a file path or a file object.
+    :param format: image file format.
+    :param profile: ``'fast'``, ``'balanced'`` or ``'small'``, see
+                    :data:`ENCODER_PROFILES`, or a dict of save options.
+                    The encoder defaults are used if it is ``None``.
+    :param quantize: reduce the image to a palette of this many colors
+                     first, for PNG and other formats with palettes. A
+                     :exc:`ValueError` is raised for JPEG.
+    """
+    options = _save_options(format, profile)
+    if quantize:
+        if _format_name(format) in _NO_PALETTE:
+            raise ValueError('%s images have no palette, they cannot be '
+                             'quantized' % format)
+        im = im.quantize(quantize, Image.FASTOCTREE)
+    return im.save(output, format, **options)
+
 
 class _Captcha(object):
-    def generate(self, chars, format='png'):
+    _rng = random
+    _async_runner = None
+    _instrument = None
+
+    def __getstate__(self):
+        # the executor of agenerate and the instrument stay in this process
+        state = self.__dict__.copy()
+        state.pop('_async_runner', None)
+        state.pop('_instrument', None)
+        return _pickle_rng(state)
+
+    def __setstate__(self, state):
+        self.__dict__.update(_unpickle_rng(state))
+
+    @property
+    def rng(self):
+        """The random generator of this instance."""
+        return self._rng
+
+    @property
+    def instrument(self):
+        """The :class:`~captcha.instrument.Instrument` measuring this
+        instance, or ``None``."""
+        return self._instrument
+
+    @instrument.setter
+    def instrument(self, instrument):
+        self._instrument = instrument
+
+    def _stage(self, name, func, *args):
+        instrument = self._instrument
+        if instrument is None:
+            return func(*args)
+        return instrument.measure(name, func, *args)
+
+    def reseed(self, seed, index=None):
+        """Reseed the random generator of this instance.
+
+        With an ``index``, the generator is seeded for that sample of a
+        batch seeded with ``seed``, so the sample can be generated again
+        on its own, see :func:`captcha.batch.derive_seed`.
+
+        :param seed: the seed, an integer.
+        :param index: the index of a sample in a seeded batch.
+        """
+        if index is not None:
+            seed = derive_seed(seed, index)
+        self._rng.seed(seed)
+
+    def generate(self, chars, format='png', profile=None, quantize=None,
+                 out=None):
         """Generate an Image Captcha of the given characters.
 
         :param chars: text to be generated.
         :param format: image file format
+        :param profile: the encoder profile, see :func:`encode_image`.
+        :param quantize: the number of palette colors, see
+                         :func:`encode_image`.
+        :param out: a :class:`io.BytesIO` to reuse, it is emptied and
+                    returned.
         """
         im = self.generate_image(chars)
-        out = BytesIO()
-        im.save(out, format=format)
+        if out is None:
+            out = BytesIO()
+        else:
+            out.seek(0)
+            out.truncate()
+        self._stage('encode', encode_image, im, out, format, profile, quantize)
         out.seek(0)
         return out
 
-    def write(self, chars, output, format='png'):
+    def write(self, chars, output, format='png', profile=None, quantize=None):
         """Generate and write an image CAPTCHA data to the output.
 
         :param chars: text to be generated.
         :param output: output destination.
         :param format: image file format
+        :param profile: the encoder profile, see :func:`encode_image`.
+        :param quantize: the number of palette colors, see
+                         :func:`encode_image`.
+        """
+        im = self.generate_image(chars)
+        return self._stage('encode', encode_image, im, output, format,
+                           profile, quantize)
+
+    def generate_array(self, chars, grayscale=False, normalize=False,
+                       out=None):
+        """Generate an image CAPTCHA of the given characters as a NumPy
+        array of shape ``(height, width, channels)``, without encoding it.
+        This requires NumPy.
+
+        :param chars: text to be generated.
+        :param grayscale: one gray channel instead of RGB.
+        :param normalize: return ``float32`` values in ``[0, 1]`` instead
+                          of ``uint8`` values.
+        :param out: an array of the right shape to fill in place, it is
+                    returned.
         """
+        if numpy is None:
+            raise RuntimeError('generate_array requires NumPy')
         im = self.generate_image(chars)
-        return im.save(output, format=format)
+        return self._stage('to_array', _image_to_array, im, grayscale,
+                           normalize, out)
+
+    def generate_arrays(self, texts, grayscale=False, normalize=False,
+                        out=None, seed=None):
+        """Generate image CAPTCHAs of many texts into one NumPy array of
+        shape ``(len(texts), height, width, channels)``::
+
+            buf = numpy.empty((256, 60, 160, 3), numpy.uint8)
+            for texts in batches:
+                captcha.generate_arrays(texts, out=buf)
+
+        :param texts: a sequence of texts to be generated.
+        :param grayscale: one gray channel instead of RGB.
+        :param normalize: ``float32`` values in ``[0, 1]`` instead of
+                          ``uint8`` values.
+        :param out: an array to fill in place, it is returned. It must
+                    have at least ``len(texts)`` rows.
+        :param seed: seed the generator from ``seed`` and the index of
+                     each text, like :meth:`generate_batch`.
+        """
+        if numpy is None:
+            raise RuntimeError('generate_arrays requires NumPy')
+        if out is None:
+            shape = (len(texts), self._height, self._width,
+                     1 if grayscale else 3)
+            out = numpy.empty(shape, numpy.float32 if normalize else numpy.uint8)
+        for index, chars in enumerate(texts):
+            if seed is not None:
+                self.reseed(seed, index)
+            self.generate_array(chars, grayscale, normalize, out[index])
+        return out
+
+    def configure_async(self, executor=None, max_concurrency=None,
+                        processes=None):
+        """Configure how :meth:`agenerate` runs.
+
+        With ``processes``, the CAPTCHAs are generated by that many worker
+        processes, each getting a copy of this instance once, as it is
+        now. With a :class:`~concurrent.futures.ProcessPoolExecutor`,
+        every call sends a copy of this instance to a worker process.
+
+        :param executor: a :class:`concurrent.futures.Executor`, the
+                         default executor of the event loop if ``None``.
+        :param max_concurrency: the maximum number of CAPTCHAs generated at
+                                once, ``None`` for no limit.
+        :param processes: the number of worker processes, instead of
+                          ``executor``.
+        """
+        from captcha._asyncio import AsyncRunner
+        if self._async_runner is not None:
+            self._async_runner.close()
+        self._async_runner = None
+        self._async_runner = AsyncRunner(executor, max_concurrency,
+                                         processes, self)
+
+    def agenerate(self, chars, format='png', profile=None, quantize=None):
+        """Generate an Image Captcha of the given characters on an
+        executor, without blocking the event loop. This is a coroutine::
+
+            data = await captcha.agenerate('1234')
+
+        Cancelling it cancels the call if it has not started yet, a
+        running call is finished and its result is dropped.
+
+        :param chars: text to be generated.
+        :param format: image file format
+        :param profile: the encoder profile, see :func:`encode_image`.
+        :param quantize: the number of palette colors, see
+                         :func:`encode_image`.
+        """
+        if self._async_runner is None:
+            self.configure_async()
+        return self._async_runner.call(self, 'generate', chars, format,
+                                       profile, quantize)
+
+    def generate_batch(self, texts, workers=None, format='png', seed=None,
+                       chunksize=8, profile=None, quantize=None):
+        """Generate image CAPTCHAs of many texts on a pool of processes.
+
+        This is a generator, the image data is yielded as bytes in the
+        order of ``texts``, which is consumed lazily::
+
+            for text, data in zip(texts, captcha.generate_batch(texts)):
+                save(text, data)
+
+        :param texts: an iterable of texts to be generated.
+        :param workers: number of worker processes, defaults to the number
+                        of CPUs. Use ``0`` to generate in this process.
+        :param format: image file format
+        :param seed: make the batch reproducible, the random generator is
+                     seeded from ``seed`` and the index of each text.
+        :param chunksize: number of texts sent to a worker at once.
+        :param profile: the encoder profile, see :func:`encode_image`.
+        :param quantize: the number of palette colors, see
+                         :func:`encode_image`.
+        """
+        tasks = ((chars, format, profile, quantize) for chars in texts)
+        return imap_batch(self, _generate_bytes, tasks, workers=workers,
+                          seed=seed, chunksize=chunksize)
+
+    def write_batch(self, texts, outputs, workers=None, format='png',
+                    seed=None, chunksize=8, profile=None, quantize=None):
+        """Generate and write image CAPTCHAs of many texts, the files are
+        written by the worker processes. Returns the number of files.
+
+        :param texts: an iterable of texts to be generated.
+        :param outputs: an iterable of output file paths, one for each text.
+        :param workers: number of worker processes, defaults to the number
+                        of CPUs. Use ``0`` to generate in this process.
+        :param format: image file format
+        :param seed: make the batch reproducible, the random generator is
+                     seeded from ``seed`` and the index of each text.
+        :param chunksize: number of texts sent to a worker at once.
+        :param profile: the encoder profile, see :func:`encode_image`.
+        :param quantize: the number of palette colors, see
+                         :func:`encode_image`.
+        """
+        tasks = ((chars, output, format, profile, quantize)
+                 for chars, output in zip(texts, outputs))
+        count = 0
+        for _ in imap_batch(self, _write_file, tasks, workers=workers,
+                            seed=seed, chunksize=chunksize):
+            count += 1
+        return count
+
+
+def _generate_bytes(captcha, chars, format, profile=None, quantize=None):
+    return captcha.generate(chars, format, profile, quantize).getvalue()
+
+
+def _write_file(captcha, chars, output, format, profile=None, quantize=None):
+    captcha.write(chars, output, format, profile, quantize)
+
+
+def _image_to_array(im, grayscale, normalize, out):
+    mode = 'L' if grayscale else 'RGB'
+    if im.mode != mode:
+        im = im.convert(mode)
+    w, h = im.size
+    data = numpy.frombuffer(im.tobytes(), numpy.uint8)
+    data = data.reshape((h, w, len(mode)))
+    if out is None:
+        if normalize:
+            return data * numpy.float32(1 / 255.0)
+        # the buffer of tobytes is read-only
+        return data.copy()
+    if normalize:
+        numpy.multiply(data, numpy.float32(1 / 255.0), out=out)
+    else:
+        out[...] = data
+    return out
 
 
 class WheezyCaptcha(_Captcha):
-    """Create an image CAPTCHA with wheezy.captcha."""
+    """Create an image CAPTCHA with wheezy.captcha.
+
+    The wheezy.captcha drawing pipeline, fonts included, is built on the
+    first CAPTCHA and reused by the next ones.
+    """
     def __init__(self, width=200, height=75, fonts=None):
         self._width = width
         self._height = height
         self._fonts = fonts or DEFAULT_FONTS
+        self._pipeline = None
+
+    def __getstate__(self):
+        # the pipeline is made of closures, rebuilt in another process
+        state = super(WheezyCaptcha, self).__getstate__()
+        state['_pipeline'] = None
+        return state
+
+    @property
+    def pipeline(self):
+        """The wheezy.captcha function rendering a text into an image."""
+        if self._pipeline is None:
+            text_drawings = [
+                wheezy_captcha.warp(),
+                wheezy_captcha.rotate(),
+                wheezy_captcha.offset(),
+            ]
+            self._pipeline = wheezy_captcha.captcha(
+                drawings=[
+                    wheezy_captcha.background(),
+                    wheezy_captcha.text(fonts=self._fonts,
+                                        drawings=text_drawings),
+                    wheezy_captcha.curve(),
+                    wheezy_captcha.noise(),
+                    wheezy_captcha.smooth(),
+                ],
+                width=self._width,
+                height=self._height,
+            )
+        return self._pipeline
 
     def generate_image(self, chars):
-        text_drawings = [
-            wheezy_captcha.warp(),
-            wheezy_captcha.rotate(),
-            wheezy_captcha.offset(),
-        ]
-        fn = wheezy_captcha.captcha(
-            drawings=[
-                wheezy_captcha.background(),
-                wheezy_captcha.text(fonts=self._fonts, drawings=text_drawings),
-                wheezy_captcha.curve(),
-                wheezy_captcha.noise(),
-                wheezy_captcha.smooth(),
-            ],
-            width=self._width,
-            height=self._height,
-        )
-        return fn(chars)
+        return self.pipeline(chars)
+
+
+class GlyphCache(LRUCache):
+    """Cache of rendered glyph bitmaps for :class:`ImageCaptcha`.
+
+    A glyph is cached cropped and un-rotated, keyed by font, font size and
+    character, so that only the random rotate and warp run per CAPTCHA. A
+    cache can be shared by many :class:`ImageCaptcha` instances::
+
+        cache = GlyphCache(maxbytes=32 * 1024 * 1024)
+        captcha = ImageCaptcha(fonts=fonts, glyph_cache=cache)
+        print(cache.stats())
+
+    :param maxsize: the maximum number of glyphs, ``None`` for no limit.
+    :param maxbytes: the maximum memory of the glyph bitmaps, 8 MB by
+                     default.
+    """
+    def __init__(self, maxsize=None, maxbytes=8 * 1024 * 1024):
+        super(GlyphCache, self).__init__(maxsize, maxbytes, _glyph_nbytes)
+
+
+def _glyph_nbytes(im):
+    w, h = im.size
+    return w * h
+
+
+def _rotation(size, angle):
+    # the output size and the output to input mapping of
+    # ``Image.rotate(angle, expand=True)``
+    w, h = size
+    angle = -math.radians(angle % 360.0)
+    cos = round(math.cos(angle), 15)
+    sin = round(math.sin(angle), 15)
+    cx, cy = w / 2.0, h / 2.0
+    xx = []
+    yy = []
+    for x, y in ((0, 0), (w, 0), (w, h), (0, h)):
+        x, y = x - cx, y - cy
+        xx.append(cos * x + sin * y + cx)
+        yy.append(-sin * x + cos * y + cy)
+    nw = int(math.ceil(max(xx)) - math.floor(min(xx)))
+    nh = int(math.ceil(max(yy)) - math.floor(min(yy)))
+    # center the input in the expanded output
+    x, y = -nw / 2.0, -nh / 2.0
+    matrix = (cos, sin, cos * x + sin * y + cx,
+              -sin, cos, -sin * x + cos * y + cy)
+    return (nw, nh), matrix
+
+
+def _render_glyph(c, font, dx, dy):
+    # the glyph is drawn at (dx, dy) on a canvas of its text box size plus
+    # (dx, dy), and cropped to its ink. When the ink is known to fit in
+    # the canvas, it is drawn on a canvas of the ink size instead.
+    width, height, ink = font_metrics.get(font, c)
+    if ink is not None:
+        x0, y0, x1, y1 = ink
+        if x0 >= -dx and y0 >= -dy and x1 <= width and y1 <= height:
+            im = Image.new('L', (x1 - x0, y1 - y0), 0)
+            with render_lock:
+                Draw(im).text((-x0, -y0), c, font=font, fill=255)
+            return im
+    im = Image.new('L', (width + dx, height + dy), 0)
+    with render_lock:
+        Draw(im).text((dx, dy), c, font=font, fill=255)
+    return im.crop(im.getbbox())
 
 
 class ImageCaptcha(_Captcha):
@@ -98,21 +488,62 @@ class ImageCaptcha(_Captcha):
 
         captcha = ImageCaptcha(fonts=['/path/to/A.ttf', '/path/to/B.ttf'])
 
-    You can put as many fonts as you like. But be aware of your memory, all of
-    the fonts are loaded into your memory, so keep them a lot, but not too
-    many.
+    You can put as many fonts as you like. A font is loaded the first time
+    it is picked, into a cache shared by every instance, see
+    :mod:`captcha.fonts`. The cache keeps at most 64 fonts by default.
 
     :param width: The width of the CAPTCHA image.
     :param height: The height of the CAPTCHA image.
     :param fonts: Fonts to be used to generate CAPTCHA images.
     :param font_sizes: Random choose a font size from this parameters.
+    :param glyph_cache: a :class:`GlyphCache` to keep rendered glyphs in,
+                        a private one is created by default. Pass ``False``
+                        to render every glyph from scratch.
+    :param legacy: render exactly like the earlier versions for the same
+                   random state, with the slower legacy background. Earlier
+                   versions used the global generator, see ``rng``.
+    :param seed: seed the private random generator of this instance.
+    :param rng: a :class:`random.Random` instance to use instead, pass the
+                :mod:`random` module to share the global generator. A copy
+                in a worker process shares the generator of that process.
+    :param instrument: an :class:`~captcha.instrument.Instrument` to
+                       measure the stages of the generation.
+    :param font_cache: a :class:`~captcha.fonts.FontCache` to load the fonts
+                       into, the process-wide one is used by default.
+    :param threadsafe: allow many threads to generate with this instance
+                       at once. Every thread draws from its own random
+                       generator, a :class:`~captcha.rng.ThreadLocalRandom`
+                       unless ``rng`` is given, and the size can not be
+                       changed, use :meth:`with_size` instead.
+
+    In the thread-safe mode, the fonts, their metrics and the glyph cache
+    are shared by every thread, and are filled under locks. The fonts are
+    shared by every instance, so glyphs always render under
+    :data:`~captcha.fonts.render_lock`. Each call
+    renders on its own images, Pillow releases the GIL in most of the
+    drawing, resampling and encoding, so the threads run in parallel.
     """
-    def __init__(self, width=160, height=60, fonts=None, font_sizes=None):
+    def __init__(self, width=160, height=60, fonts=None, font_sizes=None,
+                 glyph_cache=None, legacy=False, seed=None, rng=None,
+                 instrument=None, font_cache=None, threadsafe=False):
         self._width = width
         self._height = height
         self._fonts = fonts or DEFAULT_FONTS
         self._font_sizes = font_sizes or (42, 50, 56)
-        self._truefonts = []
+        self._font_keys = tuple(
+            (n, s) for n in self._fonts for s in self._font_sizes)
+        self._font_cache = font_cache
+        if glyph_cache is None:
+            glyph_cache = GlyphCache()
+        elif glyph_cache is False:
+            glyph_cache = None
+        self._glyph_cache = glyph_cache
+        self._legacy = legacy
+        self._threadsafe = threadsafe
+        if rng is None:
+            rng = ThreadLocalRandom(seed) if threadsafe else random.Random(seed)
+        self._rng = rng
+        self._instrument = instrument
 
         self._enable_back_text = True
         self._enable_background_noise = True
@@ -121,52 +552,103 @@ class ImageCaptcha(_Captcha):
         self._enable_noise_curve = True
         self._enable_panda = False
 
+    def _prepare_worker(self):
+        # load the fonts once when a batch worker starts, if they fit
+        cache = self.font_cache
+        if cache.maxsize is None or len(self._font_keys) <= cache.maxsize:
+            self.truefonts
+
     def set_size(self, width, height):
+        if self._threadsafe:
+            raise RuntimeError('the size of a thread-safe ImageCaptcha is '
+                               'fixed, use with_size')
         self._width = width
         self._height = height
 
+    def with_size(self, width, height):
+        """Return a copy of this instance generating images of another
+        size. The copy shares the glyph cache and the random generator of
+        this instance.
+        """
+        captcha = copy.copy(self)
+        captcha._width = width
+        captcha._height = height
+        return captcha
+
+    @property
+    def font_cache(self):
+        """The :class:`~captcha.fonts.FontCache` of this instance."""
+        if self._font_cache is None:
+            return shared_font_cache
+        return self._font_cache
+
     @property
     def truefonts(self):
-        if self._truefonts:
-            return self._truefonts
-        self._truefonts = tuple([
-            truetype(n, s)
-            for n in self._fonts
-            for s in self._font_sizes
-        ])
-        return self._truefonts
+        """Every font of this instance, all of them are loaded."""
+        cache = self.font_cache
+        return tuple(cache.get_font(n, s) for n, s in self._font_keys)
+
+    def prepare_metrics(self, chars):
+        """Measure the characters of ``chars`` in every font up front,
+        instead of the first time each is drawn. The metrics are kept in
+        :data:`captcha.fonts.font_metrics`.
+
+        :param chars: the characters CAPTCHAs are generated from.
+        """
+        for font in self.truefonts:
+            font_metrics.prepare(font, chars)
+
+    @property
+    def glyph_cache(self):
+        """The :class:`GlyphCache` of this instance, or ``None``."""
+        return self._glyph_cache
+
+    def _get_glyph(self, c, font, dx, dy):
+        cache = self._glyph_cache
+        if cache is None:
+            return _render_glyph(c, font, dx, dy)
+        # a cached glyph is rendered with the largest random padding, the
+        # padding is cropped away and only matters for glyphs with ink on
+        # the left of or above the origin, which it keeps from clipping
+        if self._legacy:
+            key = (font.path, font.size, font.index, c, dx, dy)
+            return cache.get_or_create(
+                key, lambda: _render_glyph(c, font, dx, dy))
+        key = (font.path, font.size, font.index, c)
+        return cache.get_or_create(
+            key, lambda: _render_glyph(c, font, 4, 6))
 
     @staticmethod
-    def create_noise_curve(image, color):
+    def create_noise_curve(image, color, rng=random):
         w, h = image.size
-        x1 = random.randint(0, int(w / 2))
-        x2 = random.randint(w - int(w / 2), w)
-        if rand_bool(): # down
-            y1 = random.randint(0, int(h / 2))
-            y2 = random.randint(h - int(h / 2), h)
+        x1 = rng.randint(0, int(w / 2))
+        x2 = rng.randint(w - int(w / 2), w)
+        if rand_bool(rng): # down
+            y1 = rng.randint(0, int(h / 2))
+            y2 = rng.randint(h - int(h / 2), h)
             y1 += y1-y2
-            end = random.randint(90, 180)
-            start = random.randint(0, 90)
+            end = rng.randint(90, 180)
+            start = rng.randint(0, 90)
         else: # down
-            y1 = random.randint(0, int(h / 2))
-            y2 = random.randint(h - int(h / 2), h)
+            y1 = rng.randint(0, int(h / 2))
+            y2 = rng.randint(h - int(h / 2), h)
             y2 += y2-y1
-            end = random.randint(270, 360)
-            start = random.randint(180, 270)
+            end = rng.randint(270, 360)
+            start = rng.randint(180, 270)
         points = [x1, y1, x2, y2]
         Draw(image).arc(points, start, end, fill=color)
         return image
 
     @staticmethod
-    def create_noise_dots(image, color, width=3, number=30):
+    def create_noise_dots(image, color, width=3, number=30, rng=random):
         draw = Draw(image)
         w, h = image.size
         for _ in range(number):
-            xx = random.randint(1,width)
-            yy = random.randint(1,width)
-            x = random.randint(0, w-xx)
-            y = random.randint(0, h-yy)
-            draw.ellipse(((x,y), (x+xx,y+yy)), fill=color if rand_bool() else random_color())
+            xx = rng.randint(1,width)
+            yy = rng.randint(1,width)
+            x = rng.randint(0, w-xx)
+            y = rng.randint(0, h-yy)
+            draw.ellipse(((x,y), (x+xx,y+yy)), fill=color if rand_bool(rng) else random_color(rng=rng))
         return image
 
     def create_captcha_background(self, background_avoid):
@@ -176,17 +658,50 @@ class ImageCaptcha(_Captcha):
 
         The color should be a tuple of 3 numbers, such as (0, 255, 255).
         """
+        if self._legacy:
+            return self._create_legacy_background(background_avoid)
+
+        rng = self._rng
+        width, height = self._width, self._height
+        chunk_max = max(1, int(max(width, height) / 10)) if self._enable_background_noise else 1
+        chunk = rng.randint(1, chunk_max), rng.randint(1, chunk_max)
+        if self._enable_panda:
+            image = Image.new('RGB', chunk, (0, 0, 0))
+        else:
+            data = random_color_grid(chunk[0] * chunk[1], background_avoid, 64, rng)
+            image = Image.frombytes('RGB', chunk, data)
+
+        # Scale the color grid up to a square larger than the diagonal,
+        # rotate it and take the center. This is done as one affine
+        # mapping from the output pixels back to the grid, instead of
+        # resampling the big square twice.
+        resample = rng.choice([Image.NEAREST, Image.BILINEAR])
+        angle = math.radians(rng.random() * 360)
+        big_side = math.ceil((width * width + height * height) ** 0.5) + 4
+        sx = chunk[0] / float(big_side)
+        sy = chunk[1] / float(big_side)
+        cos, sin = math.cos(angle), math.sin(angle)
+        a, b = sx * cos, sx * sin
+        d, e = -sy * sin, sy * cos
+        data = (
+            a, b, chunk[0] / 2.0 - a * width / 2.0 - b * height / 2.0,
+            d, e, chunk[1] / 2.0 - d * width / 2.0 - e * height / 2.0,
+        )
+        return image.transform((width, height), Image.AFFINE, data, resample)
+
+    def _create_legacy_background(self, background_avoid):
+        rng = self._rng
         chunk_max = max(1,int(max(self._width, self._height)/10)) if self._enable_background_noise else 1
-        chunk = random.randint(1,chunk_max), random.randint(1,chunk_max)
+        chunk = rng.randint(1,chunk_max), rng.randint(1,chunk_max)
         image = Image.new('RGB', chunk, (0,0,0))
         draw = Draw(image)
         for x in range(chunk[0]):
             for y in range(chunk[1]):
-                color = random_color(background_avoid,64) if not self._enable_panda else (0,0,0,255)
+                color = random_color(background_avoid,64,rng) if not self._enable_panda else (0,0,0,255)
                 draw.point((x,y),color)
         big_side = math.ceil((self._width*self._width+self._height*self._height)**0.5)+4
-        image = image.resize((big_side, big_side),random.choice([Image.NEAREST,Image.BILINEAR]))
-        image = image.rotate(random.random()*360, random.choice([Image.NEAREST,Image.BILINEAR]))
+        image = image.resize((big_side, big_side),rng.choice([Image.NEAREST,Image.BILINEAR]))
+        image = image.rotate(rng.random()*360, rng.choice([Image.NEAREST,Image.BILINEAR]))
         crop_x0 = int((big_side-self._width)/2)
         crop_y0 = int((big_side-self._height)/2)
         crop_x1 = crop_x0 + self._width
@@ -204,113 +719,242 @@ class ImageCaptcha(_Captcha):
         """
         if len(chars) <= 0:
             return image
-        
-        draw = Draw(image)
 
-        def _draw_character(c):
-            font = random.choice(self.truefonts)
-            w, h = draw.textsize(c, font=font)
-
-            dx = random.randint(0, 4)
-            dy = random.randint(0, 6)
-            im = Image.new('L', (w + dx, h + dy), 0)
-            Draw(im).text((dx, dy), c, font=font, fill=255)
-
-            # rotate
-            im = im.crop(im.getbbox())
-            im = im.rotate(random.uniform(-30, 30), Image.BILINEAR, expand=max(im.size))
-            #im = im.crop(im.getbbox())
-
-            # warp
-            w, h = im.size
-            dx = w * random.uniform(0.1, 0.3)
-            dy = h * random.uniform(0.2, 0.3)
-            x1 = int(random.uniform(-dx, dx))
-            y1 = int(random.uniform(-dy, dy))
-            x2 = int(random.uniform(-dx, dx))
-            y2 = int(random.uniform(-dy, dy))
-            w2 = w + abs(x1) + abs(x2)
-            h2 = h + abs(y1) + abs(y2)
-            data = (
-                x1, y1,
-                -x1, h2 - y2,
-                w2 + x2, h2 + y2,
-                w2 - x2, -y1,
-            )
-            im = im.resize((w2, h2))
-            im = im.transform((w, h), Image.QUAD, data)
-            im = im.crop(im.getbbox())
-            return im
+        images = [self._draw_character(c) for c in chars]
+        return self._stage('paste', self._paste_characters, image, images,
+                           color, back_color, back_color_count, back_radius)
+
+    def _draw_character(self, c):
+        rng = self._rng
+        font = self.font_cache.get_font(*rng.choice(self._font_keys))
+        dx = rng.randint(0, 4)
+        dy = rng.randint(0, 6)
+        im = self._stage('char_draw', self._get_glyph, c, font, dx, dy)
+        if not self._legacy:
+            return self._stage('char_transform', self._transform_character, im)
+        im = self._stage('char_rotate', self._rotate_character, im)
+        return self._stage('char_warp', self._warp_character, im)
+
+    def _transform_character(self, im):
+        # The rotate, resize and quad warp of the legacy path, as a single
+        # quad transform: the warp maps the output corners to a quad of the
+        # resized image, scaling that quad back and rotating it into the
+        # glyph gives the quad to sample the glyph at, with the same
+        # random parameters.
+        rng = self._rng
+        (w, h), matrix = _rotation(im.size, rng.uniform(-30, 30))
+        quad = self._warp_quad(w, h)
+        w2, h2 = quad[-2:]
+        a, b, c, d, e, f = matrix
+        data = []
+        for x, y in zip(quad[0:8:2], quad[1:8:2]):
+            x = x * w / float(w2)
+            y = y * h / float(h2)
+            data.extend((a * x + b * y + c, d * x + e * y + f))
+        im = im.transform((w, h), Image.QUAD, data, Image.BILINEAR)
+        return im.crop(im.getbbox())
+
+    def _warp_quad(self, w, h):
+        rng = self._rng
+        dx = w * rng.uniform(0.1, 0.3)
+        dy = h * rng.uniform(0.2, 0.3)
+        x1 = int(rng.uniform(-dx, dx))
+        y1 = int(rng.uniform(-dy, dy))
+        x2 = int(rng.uniform(-dx, dx))
+        y2 = int(rng.uniform(-dy, dy))
+        w2 = w + abs(x1) + abs(x2)
+        h2 = h + abs(y1) + abs(y2)
+        return (
+            x1, y1,
+            -x1, h2 - y2,
+            w2 + x2, h2 + y2,
+            w2 - x2, -y1,
+            w2, h2,
+        )
 
-        images = []
-        for c in chars:
-            images.append(_draw_character(c))
+    def _rotate_character(self, im):
+        rng = self._rng
+        im = im.rotate(rng.uniform(-30, 30), Image.BILINEAR, expand=max(im.size))
+        #im = im.crop(im.getbbox())
+        return im
+
+    def _warp_character(self, im):
+        w, h = im.size
+        data = self._warp_quad(w, h)
+        w2, h2 = data[-2:]
+        data = data[:8]
+        im = im.resize((w2, h2))
+        im = im.transform((w, h), Image.QUAD, data)
+        im = im.crop(im.getbbox())
+        return im
 
+    def _paste_characters(self, image, images, color, back_color, back_color_count, back_radius):
+        rng = self._rng
         text_width = sum([im.size[0] for im in images])
 
         width = max(text_width, self._width)
         image = image.resize((width, self._height))
 
-        average = int(text_width / len(chars))
+        average = int(text_width / len(images))
         rand = int(0.35 * average)
         offset0 = int(average * 0.1)
 
-        neg_off_list = [ random.randint(-rand, 0) for _ in images ]
+        neg_off_list = [ rng.randint(-rand, 0) for _ in images ]
         y_max_list = [ self._height-im.size[1] for im in images ]
-        y_list = [ (random.randint(0,y) if (y >= 0) else int(y/2)) for y in y_max_list ]
+        y_list = [ (rng.randint(0,y) if (y >= 0) else int(y/2)) for y in y_max_list ]
         offset0_max = max(0,width-text_width-sum(neg_off_list[:-1])-offset0*2)
-        offset0 += random.randint(0,offset0_max)
-
-        for _ in range(back_color_count):
-            xs,ys = tuple(int(i*back_radius) for i in random_vector(2))
-            offset=offset0
-            for im, neg_off, y in zip(images,neg_off_list,y_list):
+        offset0 += rng.randint(0,offset0_max)
+
+        offsets = []
+        offset = offset0
+        for im, neg_off in zip(images, neg_off_list):
+            offsets.append(offset)
+            offset = offset + im.size[0] + neg_off
+        shifts = [tuple(int(i*back_radius) for i in random_vector(2, rng))
+                  for _ in range(back_color_count)]
+
+        if self._legacy:
+            self._paste_characters_legacy(image, images, offsets, y_list,
+                                          color, back_color, shifts)
+        elif images:
+            # Composite the glyphs into one text mask, and the shifted text
+            # masks into one shadow mask, then paste each color once.
+            # Pasting 255 through a mask blends like pasting a color does,
+            # so the result is the same as pasting every glyph in turn.
+            x0 = min(offsets)
+            y0 = min(y_list)
+            x1 = max(x + im.size[0] for im, x in zip(images, offsets))
+            y1 = max(y + im.size[1] for im, y in zip(images, y_list))
+            text = Image.new('L', (x1 - x0, y1 - y0), 0)
+            for im, x, y in zip(images, offsets, y_list):
                 w, h = im.size
+                text.paste(255, (x - x0, y - y0, x - x0 + w, y - y0 + h), im)
+            if shifts:
+                xs = [s[0] for s in shifts]
+                ys = [s[1] for s in shifts]
+                left, top = x0 + min(xs), y0 + min(ys)
+                shadow = Image.new('L', (x1 + max(xs) - left,
+                                         y1 + max(ys) - top), 0)
+                w, h = text.size
+                for dx, dy in shifts:
+                    x, y = x0 + dx - left, y0 + dy - top
+                    shadow.paste(255, (x, y, x + w, y + h), text)
+                w, h = shadow.size
+                image.paste(back_color, (left, top, left + w, top + h), shadow)
+            image.paste(color, (x0, y0, x1, y1), text)
+
+        if width != self._width:
+            image = image.resize((self._width, self._height))
+        
+        return image
+
+    @staticmethod
+    def _paste_characters_legacy(image, images, offsets, y_list, color, back_color, shifts):
+        for xs, ys in shifts:
+            for im, offset, y in zip(images, offsets, y_list):
                 #mask = im.convert('L').point(table)
                 rgb_img = Image.new('RGB', im.size, back_color)
                 mask = im
                 image.paste(rgb_img, (offset+xs, y+ys), mask)
-                offset = offset + w + neg_off
 
-        offset=offset0
-        for im, neg_off, y in zip(images,neg_off_list,y_list):
-            w, h = im.size
+        for im, offset, y in zip(images, offsets, y_list):
             #mask = im.convert('L').point(table)
             rgb_img = Image.new('RGB', im.size, color)
             mask = im
             image.paste(rgb_img, (offset, y), mask)
-            offset = offset + w + neg_off
-
-        if width != self._width:
-            image = image.resize((self._width, self._height))
-        
-        return image
 
     def generate_image(self, chars):
         """Generate the image of the given characters.
 
         :param chars: text to be generated.
         """
-        color = random_color() if not self._enable_panda else (255,255,255,255)
-        back_color = random_color(color,64) if not self._enable_panda else (0,0,0,255)
-        back_color_count = random.randint(1,10) if (self._enable_back_text and rand_bool()) else 0
+        return self._stage('generate_image', self._generate_image, chars)
+
+    def _generate_image(self, chars):
+        rng = self._rng
+        color = random_color(rng=rng) if not self._enable_panda else (255,255,255,255)
+        back_color = random_color(color,64,rng) if not self._enable_panda else (0,0,0,255)
+        back_color_count = rng.randint(1,10) if (self._enable_back_text and rand_bool(rng)) else 0
         background_avoid_color = color if back_color_count == 0 else None
-        dot_count   = random.randint(0,40) if self._enable_noise_dot else 0
-        curve_count = random.randint(0,10) if self._enable_noise_curve else 0
-        
-        im = self.create_captcha_background(background_avoid_color)
-        im = self.create_captcha_text(im, chars, color, back_color, back_color_count, 5)
-        self.create_noise_dots(im, color, number=dot_count)
+        dot_count   = rng.randint(0,40) if self._enable_noise_dot else 0
+        curve_count = rng.randint(0,10) if self._enable_noise_curve else 0
+        instrument = self._instrument
+        if instrument is not None:
+            instrument.begin({
+                'text_length': len(chars),
+                'back_color_count': back_color_count,
+                'dot_count': dot_count,
+                'curve_count': curve_count,
+            })
+
+        im = self._stage('background', self.create_captcha_background, background_avoid_color)
+        im = self._stage('text', self.create_captcha_text, im, chars, color, back_color, back_color_count, 5)
+        if self._legacy:
+            self._stage('noise_dots', self.create_noise_dots, im, color, 3, dot_count, rng)
+            self._stage('noise_curves', self._create_noise_curves, im, color, curve_count)
+        else:
+            self._stage('noise', self._create_noise, im, color, dot_count, curve_count)
+        smooth = rand_bool(rng)
+        if instrument is not None:
+            instrument.knob('smooth', smooth)
+        if smooth:
+            im = self._stage('smooth', im.filter, ImageFilter.SMOOTH)
+        return im
+
+    def _create_noise_curves(self, im, color, number):
+        rng = self._rng
+        for _ in range(number):
+            self.create_noise_curve(im, color if rand_bool(rng) else random_color(rng=rng), rng)
+        return im
+
+    def _create_noise(self, im, color, dot_count, curve_count):
+        # The dots and curves of create_noise_dots and create_noise_curve,
+        # with the same distributions. Their parameters are drawn first,
+        # with one random() call per number instead of randint, then
+        # everything is drawn with one Draw.
+        rand = self._rng.random
+        w, h = im.size
+
+        def fill():
+            if rand() < 0.5:
+                return color
+            return (int(rand() * 256), int(rand() * 256), int(rand() * 256), 255)
+
+        dots = []
+        for _ in range(dot_count):
+            xx = 1 + int(rand() * 3)
+            yy = 1 + int(rand() * 3)
+            x = int(rand() * (w - xx + 1))
+            y = int(rand() * (h - yy + 1))
+            dots.append(((x, y, x + xx, y + yy), fill()))
+
+        curves = []
         for _ in range(curve_count):
-            self.create_noise_curve(im, color if rand_bool() else random_color())
-        if rand_bool():
-            im = im.filter(ImageFilter.SMOOTH)
+            x1 = int(rand() * (w // 2 + 1))
+            x2 = w - w // 2 + int(rand() * (w // 2 + 1))
+            y1 = int(rand() * (h // 2 + 1))
+            y2 = h - h // 2 + int(rand() * (h // 2 + 1))
+            if rand() < 0.5:
+                y1 += y1 - y2
+                start = int(rand() * 91)
+                end = 90 + int(rand() * 91)
+            else:
+                y2 += y2 - y1
+                start = 180 + int(rand() * 91)
+                end = 270 + int(rand() * 91)
+            curves.append(((x1, y1, x2, y2), start, end, fill()))
+
+        draw = Draw(im)
+        for box, ink in dots:
+            draw.ellipse(box, fill=ink)
+        for box, start, end, ink in curves:
+            draw.arc(box, start, end, fill=ink)
         return im
 
 
-def random_color(avoid_color=None, min_radius=None):
+def random_color(avoid_color=None, min_radius=None, rng=random):
     while(True):
-        ret = (random.randint(0, 255),random.randint(0, 255),random.randint(0, 255),255)
+        ret = (rng.randint(0, 255),rng.randint(0, 255),rng.randint(0, 255),255)
         if avoid_color is None:
             return ret
         diff = [a-b for a,b in zip(ret, avoid_color)]
@@ -319,12 +963,32 @@ def random_color(avoid_color=None, min_radius=None):
         if radius2 >= min_radius*min_radius:
             return ret
 
-def rand_bool():
-    return random.random()<0.5
+def random_color_grid(count, avoid_color=None, min_radius=None, rng=random):
+    """Generate ``count`` random RGB colors as raw bytes, in one draw
+    from the random generator. Colors closer than ``min_radius`` to
+    ``avoid_color`` are drawn again with :func:`random_color`.
+    """
+    nbytes = count * 3
+    bits = rng.getrandbits(nbytes * 8) if nbytes else 0
+    data = bytearray(binascii.unhexlify('%0*x' % (nbytes * 2, bits)))
+    if avoid_color is None:
+        return bytes(data)
+
+    r0, g0, b0 = avoid_color[:3]
+    radius2 = min_radius * min_radius
+    for i in range(0, nbytes, 3):
+        r, g, b = data[i:i + 3]
+        if (r - r0) ** 2 + (g - g0) ** 2 + (b - b0) ** 2 < radius2:
+            data[i:i + 3] = bytearray(random_color(avoid_color, min_radius, rng)[:3])
+    return bytes(data)
+
+
+def rand_bool(rng=random):
+    return rng.random()<0.5
 
-def random_vector(ndim):
+def random_vector(ndim, rng=random):
     while True:
-        ret = tuple((random.random()*2-1) for _ in range(ndim))
+        ret = tuple((rng.random()*2-1) for _ in range(ndim))
         norm2 = sum((r*r) for r in ret)
         if norm2 <= 1:
             return ret
@@ -0,0 +1,224 @@
+# coding: utf-8
+"""
+    captcha.instrument
+    ~~~~~~~~~~~~~~~~~~
+
+    Measure where CAPTCHA generation spends its time.
+
+    An instrument receives the wall time of every stage of
+    :meth:`ImageCaptcha.generate_image <captcha.image.ImageCaptcha.generate_image>`
+    and the values of the random knobs of the call, such as the number of
+    noise dots. Nothing is measured unless an instrument is set::
+
+        stats = StatsCollector()
+        captcha = ImageCaptcha(instrument=stats)
+        ...
+        print(stats.stats())
+"""
+
+import threading
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+__all__ = ['Instrument', 'Histogram', 'StatsCollector']
+
+try:
+    clock = time.perf_counter
+except AttributeError:
+    clock = time.time
+
+#: upper bounds of the default histogram buckets, in milliseconds
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250)
+_ALLOC_BUCKETS = tuple(1 << n for n in range(10, 25, 2))
+
+
+class Instrument(object):
+    """The base class of instruments, subclasses override :meth:`begin`,
+    :meth:`knob` and :meth:`stage`.
+
+    :param trace_allocations: also measure the memory allocated by every
+                              stage, with :mod:`tracemalloc`. It only sees
+                              allocations made through Python, and slows
+                              the generation down a lot.
+    """
+    def __init__(self, trace_allocations=False):
+        self.trace_allocations = trace_allocations
+        self._peaks = threading.local()
+        if trace_allocations:
+            if tracemalloc is None:
+                raise RuntimeError('tracemalloc is not available')
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+    def begin(self, knobs):
+        """Called at the start of a generation with the random knob values
+        drawn up front, a dict."""
+
+    def knob(self, name, value):
+        """Called with a random knob value drawn during a generation."""
+
+    def stage(self, name, seconds, nbytes=None):
+        """Called when a stage has finished.
+
+        :param name: the stage name.
+        :param seconds: the wall time of the stage.
+        :param nbytes: the peak memory allocated by the stage, if
+                       ``trace_allocations`` is enabled.
+        """
+
+    def measure(self, name, func, *args):
+        """Run ``func(*args)`` as the stage ``name``."""
+        if not self.trace_allocations:
+            start = clock()
+            rv = func(*args)
+            self.stage(name, clock() - start)
+            return rv
+
+        # the peaks of the running stages of this thread, outermost first.
+        # Resetting the peak for a nested stage drops the peak of the
+        # stages around it, so it is kept here first.
+        peaks = getattr(self._peaks, 'stack', None)
+        if peaks is None:
+            peaks = self._peaks.stack = []
+        before, peak = tracemalloc.get_traced_memory()
+        if peaks:
+            peaks[-1] = max(peaks[-1], peak)
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        peaks.append(before)
+        try:
+            start = clock()
+            rv = func(*args)
+            seconds = clock() - start
+        finally:
+            inner = peaks.pop()
+        current, peak = tracemalloc.get_traced_memory()
+        peak = max(peak, current, inner)
+        if peaks:
+            peaks[-1] = max(peaks[-1], peak)
+        self.stage(name, seconds, peak - before)
+        return rv
+
+
+class Histogram(object):
+    """A histogram with fixed buckets.
+
+    :param buckets: the sorted upper bounds of the buckets, an extra
+                    bucket collects everything larger.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value):
+        i = 0
+        for bound in self.buckets:
+            if value <= bound:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def as_dict(self):
+        """Return the histogram as a dict, with cumulative bucket counts
+        like the ``le`` buckets of Prometheus."""
+        cumulative = []
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return {
+            'buckets': cumulative,
+            'count': self.count,
+            'sum': self.sum,
+            'max': self.max,
+        }
+
+
+class StatsCollector(Instrument):
+    """An instrument keeping histograms of the stage times in
+    milliseconds, and of the allocations in bytes if traced.
+
+    Every stage time is also recorded per value of each knob of the call,
+    e.g. the ``paste`` time for each ``back_color_count``.
+
+    :param trace_allocations: also measure allocations, see
+                              :class:`Instrument`.
+    :param buckets: the histogram buckets of stage times, in milliseconds.
+    """
+    def __init__(self, trace_allocations=False, buckets=DEFAULT_BUCKETS):
+        super(StatsCollector, self).__init__(trace_allocations)
+        self._buckets = buckets
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.times = {}
+        self.allocations = {}
+        self.knob_times = {}
+        self.knob_counts = {}
+
+    def begin(self, knobs):
+        self._local.knobs = {}
+        for name, value in knobs.items():
+            self.knob(name, value)
+
+    def knob(self, name, value):
+        self._local.knobs[name] = value
+        with self._lock:
+            counts = self.knob_counts.setdefault(name, {})
+            counts[value] = counts.get(value, 0) + 1
+
+    def stage(self, name, seconds, nbytes=None):
+        ms = seconds * 1000
+        knobs = getattr(self._local, 'knobs', {})
+        with self._lock:
+            self._histogram(self.times, name).observe(ms)
+            if nbytes is not None:
+                self._histogram(self.allocations, name, _ALLOC_BUCKETS).observe(nbytes)
+            for knob, value in knobs.items():
+                self._histogram(self.knob_times, (name, knob, value)).observe(ms)
+
+    def _histogram(self, histograms, key, buckets=None):
+        hist = histograms.get(key)
+        if hist is None:
+            hist = histograms[key] = Histogram(buckets or self._buckets)
+        return hist
+
+    def stats(self):
+        """Return every histogram as a dict:
+
+        * ``times``: stage name to the histogram of its time in ms.
+        * ``allocations``: stage name to the histogram of bytes allocated.
+        * ``knob_times``: ``'stage/knob/value'`` to the histogram of the
+          stage time in the calls where the knob had this value.
+        * ``knobs``: knob name to the number of calls per value.
+        """
+        with self._lock:
+            return {
+                'times': dict((k, h.as_dict()) for k, h in self.times.items()),
+                'allocations': dict(
+                    (k, h.as_dict()) for k, h in self.allocations.items()),
+                'knob_times': dict(
+                    ('%s/%s/%s' % k, h.as_dict())
+                    for k, h in self.knob_times.items()),
+                'knobs': dict(
+                    (k, dict(v)) for k, v in self.knob_counts.items()),
+            }
+
+    def reset(self):
+        """Drop every recorded value."""
+        with self._lock:
+            self.times = {}
+            self.allocations = {}
+            self.knob_times = {}
+            self.knob_counts = {}
+
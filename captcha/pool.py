@@ -0,0 +1,212 @@
+# coding: utf-8
+"""
+    captcha.pool
+    ~~~~~~~~~~~~
+
+    Keep a pool of pre-generated CAPTCHAs, refilled in the background, so
+    that serving a CAPTCHA does not pay for generating it.
+"""
+
+import collections
+import random
+import string
+import threading
+import time
+
+__all__ = ['CaptchaPool']
+
+#: the longest wait of a refill thread after a failed generation, in seconds
+MAX_RETRY_DELAY = 10.0
+
+
+def _random_digits(rng, length=4):
+    return ''.join(rng.choice(string.digits) for _ in range(length))
+
+
+class CaptchaPool(object):
+    """A bounded pool of ready ``(text, data)`` pairs.
+
+    Background threads refill the pool up to ``high`` items whenever it
+    drops to ``low``. :meth:`get` takes one item from the pool, or
+    generates one on demand when the pool is empty::
+
+        pool = CaptchaPool(ImageCaptcha(), high=500, low=100)
+        pool.start()
+        text, data = pool.get()
+
+    One pool serves one kind of CAPTCHA, create a pool for each format
+    and size you serve.
+
+    :param captcha: an :class:`~captcha.image.ImageCaptcha`,
+                    :class:`~captcha.audio.AudioCaptcha` or any object
+                    with a ``generate`` method.
+    :param text: a function returning the text of a new CAPTCHA. By
+                 default ``captcha.random()`` is used if it exists, or 4
+                 random digits.
+    :param high: the number of items a refill fills the pool up to.
+    :param low: a refill starts when the pool has this many items or
+                fewer, defaults to half of ``high``.
+    :param threads: the number of background refill threads.
+    :param format: the image file format, for image CAPTCHAs.
+    """
+    def __init__(self, captcha, text=None, high=100, low=None, threads=1,
+                 format=None):
+        if text is None:
+            if hasattr(captcha, 'random'):
+                text = lambda: ''.join(captcha.random())
+            else:
+                rng = random.Random()
+                text = lambda: _random_digits(rng)
+        if low is None:
+            low = high // 2
+        if not 0 <= low <= high:
+            raise ValueError('low must be between 0 and high')
+
+        self.captcha = captcha
+        self.text = text
+        self.high = high
+        self.low = low
+        self.format = format
+        self._threads = []
+        self._nthreads = threads
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self._refilling = False
+        self._closed = False
+        self._pending = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.errors = 0
+        self.last_error = None
+        self._refill_times = collections.deque(maxlen=1000)
+
+    def __len__(self):
+        return len(self._items)
+
+    def _generate(self):
+        text = self.text()
+        if self.format is None:
+            data = self.captcha.generate(text)
+        else:
+            data = self.captcha.generate(text, format=self.format)
+        if hasattr(data, 'getvalue'):
+            data = data.getvalue()
+        return text, data
+
+    def start(self):
+        """Start the refill threads, the pool is filled up to ``high``.
+        Starting a started pool does nothing.
+        """
+        with self._cond:
+            if self._threads:
+                return
+            self._closed = False
+            self._refilling = True
+            for _ in range(self._nthreads):
+                t = threading.Thread(target=self._refill)
+                t.daemon = True
+                t.start()
+                self._threads.append(t)
+
+    def stop(self, timeout=None):
+        """Stop the refill threads."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def fill(self):
+        """Fill the pool up to ``high`` in the calling thread."""
+        while True:
+            with self._cond:
+                if len(self._items) + self._pending >= self.high:
+                    return
+                self._pending += 1
+            try:
+                item = self._generate()
+            except Exception:
+                with self._cond:
+                    self._pending -= 1
+                raise
+            with self._cond:
+                self._pending -= 1
+                self._items.append(item)
+
+    def get(self):
+        """Get a ``(text, data)`` pair. It is taken from the pool, or
+        generated on demand if the pool is empty.
+        """
+        try:
+            item = self._items.popleft()
+        except IndexError:
+            item = None
+        with self._cond:
+            if item is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            if len(self._items) <= self.low and not self._refilling:
+                self._refilling = True
+                self._cond.notify_all()
+        if item is None:
+            item = self._generate()
+        return item
+
+    def _refill(self):
+        delay = 0.1
+        while True:
+            with self._cond:
+                while not self._closed and not self._refilling:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                if len(self._items) + self._pending >= self.high:
+                    self._refilling = False
+                    continue
+                self._pending += 1
+
+            try:
+                item = self._generate()
+            except Exception as e:
+                # keep refilling, after a growing delay
+                with self._cond:
+                    self._pending -= 1
+                    self.errors += 1
+                    self.last_error = e
+                    if not self._closed:
+                        self._cond.wait(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+                continue
+            delay = 0.1
+            with self._cond:
+                self._pending -= 1
+                self._items.append(item)
+                self.generated += 1
+                self._refill_times.append(time.time())
+
+    def stats(self):
+        """Return the pool metrics as a dict: the pool ``depth``, the
+        ``hits`` served from the pool and the ``misses`` generated on
+        demand, the number of items ``generated`` by the refill threads
+        and the number of their ``errors``, and the ``refill_rate`` in items per second over the last 1000
+        refilled items.
+        """
+        times = list(self._refill_times)
+        if len(times) > 1 and times[-1] > times[0]:
+            rate = (len(times) - 1) / (times[-1] - times[0])
+        else:
+            rate = 0.0
+        return {
+            'depth': len(self._items),
+            'high': self.high,
+            'low': self.low,
+            'hits': self.hits,
+            'misses': self.misses,
+            'generated': self.generated,
+            'errors': self.errors,
+            'refill_rate': rate,
+        }
@@ -0,0 +1,165 @@
+# coding: utf-8
+"""
+    captcha.rng
+    ~~~~~~~~~~~
+
+    A random generator for CAPTCHA instances shared by many threads, and
+    vectorized draws of random numbers with NumPy.
+"""
+
+import random
+import binascii
+import threading
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from captcha.batch import derive_seed
+
+__all__ = ['ThreadLocalRandom', 'randints', 'randoms']
+
+
+class ThreadLocalRandom(object):
+    """A random generator with its own :class:`random.Random` in each
+    thread, so that threads sharing a CAPTCHA instance neither contend for
+    one generator nor interleave their random sequences::
+
+        captcha = AudioCaptcha(rng=ThreadLocalRandom())
+
+    Every method of :class:`random.Random` is available, and applies to
+    the generator of the calling thread, ``seed`` included.
+
+    :param seed: seed the generator of the n-th thread using it with
+                 ``derive_seed(seed, n)``. The generators are seeded from
+                 the system by default.
+    """
+    def __init__(self, seed=None):
+        self.seed_value = seed
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._count = 0
+
+    def __getstate__(self):
+        return {'seed': self.seed_value}
+
+    def __setstate__(self, state):
+        self.__init__(state['seed'])
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.local(), name)
+
+    def local(self):
+        """The :class:`random.Random` of the calling thread."""
+        try:
+            return self._local.rng
+        except AttributeError:
+            pass
+        with self._lock:
+            index = self._count
+            self._count += 1
+        if self.seed_value is None:
+            rng = random.Random()
+        else:
+            rng = random.Random(derive_seed(self.seed_value, index))
+        self._local.rng = rng
+        return rng
+
+
+#: stands for the :mod:`random` module in a pickled CAPTCHA instance
+_GLOBAL = '<random>'
+
+
+def _pickle_rng(state):
+    # the random module cannot be pickled, a copy uses the random module
+    # of its process
+    if state.get('_rng') is random:
+        state['_rng'] = _GLOBAL
+    return state
+
+
+def _unpickle_rng(state):
+    if state.get('_rng') == _GLOBAL:
+        state['_rng'] = random
+    return state
+
+
+def _randbelow_fast(rng):
+    inst = getattr(rng.randint, '__self__', rng)
+    fast = getattr(random.Random, '_randbelow_with_getrandbits', None)
+    if fast is None:
+        return None
+    func = getattr(getattr(inst, '_randbelow', None), '__func__', None)
+    if func is not fast:
+        return None
+    return inst
+
+
+#: the most words drawn from the generator at once
+BLOCK_SIZE = 1 << 15
+
+
+def _words(rng, n):
+    # ``n`` 32-bit outputs of the generator, in the order they are drawn,
+    # the first one is the lowest word of ``getrandbits``
+    bits = rng.getrandbits(32 * n)
+    if hasattr(bits, 'to_bytes'):
+        raw = bits.to_bytes(4 * n, 'little')
+        return numpy.frombuffer(raw, dtype='<u4')
+    # Python 2 has no int.to_bytes
+    raw = binascii.unhexlify('%0*x' % (8 * n, bits))
+    return numpy.frombuffer(raw, dtype='>u4')[::-1]
+
+
+def randints(rng, length, a, b, dtype=None):
+    """Draw ``length`` integers like ``[rng.randint(a, b) ...]`` does, as
+    a NumPy array of ``dtype``, ``int64`` by default."""
+    if dtype is None:
+        dtype = numpy.int64
+    width = b - a + 1
+    k = width.bit_length()
+    inst = _randbelow_fast(rng)
+    if inst is None or k > 32:
+        randint = rng.randint
+        return numpy.array([randint(a, b) for _ in range(length)],
+                           dtype=dtype)
+
+    # ``randint`` takes the top ``k`` bits of one 32-bit Mersenne Twister
+    # output per attempt and rejects values out of range. Drawing exactly
+    # as many words as values still missing never consumes more words
+    # than the sequential loop would, so the generator ends in the same
+    # state.
+    rv = numpy.empty(length, dtype=dtype)
+    pos = 0
+    while pos < length:
+        need = min(length - pos, BLOCK_SIZE)
+        words = _words(inst, need) >> (32 - k)
+        taken = words[words < width]
+        rv[pos:pos + len(taken)] = taken
+        pos += len(taken)
+    rv += a
+    return rv
+
+
+def randoms(rng, length):
+    """Draw ``length`` floats like ``[rng.random() ...]`` does, as a NumPy
+    array."""
+    inst = getattr(rng.random, '__self__', rng)
+    cls = type(inst)
+    if (not isinstance(inst, random.Random) or
+            cls.random is not random.Random.random or
+            cls.getrandbits is not random.Random.getrandbits):
+        return numpy.array([rng.random() for _ in range(length)])
+
+    # ``random`` combines the top 27 and 26 bits of two 32-bit outputs
+    rv = numpy.empty(length, dtype=numpy.float64)
+    for pos in range(0, length, BLOCK_SIZE):
+        need = min(length - pos, BLOCK_SIZE)
+        words = _words(inst, 2 * need).reshape(need, 2)
+        a = (words[:, 0] >> 5).astype(numpy.float64)
+        b = (words[:, 1] >> 6).astype(numpy.float64)
+        rv[pos:pos + need] = (a * 67108864.0 + b) * (1.0 / 9007199254740992.0)
+    return rv
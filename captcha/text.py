@@ -0,0 +1,260 @@
+# coding: utf-8
+"""
+    captcha.text
+    ~~~~~~~~~~~~
+
+    Sources of random CAPTCHA texts, for generating CAPTCHAs in bulk.
+
+    A text source is an iterable of texts, generated lazily in blocks, so
+    that any number of texts can be streamed into the batch generation
+    methods without keeping them in memory::
+
+        texts = UniformText(string.digits, length=(4, 6), count=10 ** 7,
+                            seed=1)
+        for text, data in zip(texts, captcha.generate_batch(texts)):
+            save(text, data)
+
+    A seeded source yields the same texts every time it is iterated, as
+    above. The texts are the same whether NumPy is installed or not, it
+    only makes drawing a block faster.
+"""
+
+import os
+import mmap
+import array
+import random
+import bisect
+import itertools
+
+try:
+    import numpy
+    from captcha.rng import randints, randoms
+except ImportError:
+    numpy = None
+
+__all__ = ['TextSource', 'UniformText', 'WeightedText', 'DictionaryText',
+           'WordList']
+
+
+def _length_range(length):
+    if isinstance(length, int):
+        return length, length
+    low, high = length
+    if not 0 <= low <= high:
+        raise ValueError('invalid length range %r' % (length,))
+    return low, high
+
+
+def _draw_ints(rng, n, a, b):
+    if numpy is not None:
+        return randints(rng, n, a, b).tolist()
+    return [rng.randint(a, b) for _ in range(n)]
+
+
+def _draw_floats(rng, n):
+    if numpy is not None:
+        return randoms(rng, n).tolist()
+    return [rng.random() for _ in range(n)]
+
+
+class TextSource(object):
+    """The base class of text sources, subclasses implement
+    :meth:`draw_block`.
+
+    :param length: the number of units of a text, or a ``(min, max)``
+                   range.
+    :param count: the number of texts, ``None`` for no end.
+    :param seed: the seed of the texts, every iteration yields the same
+                 texts. Without a seed, ``rng`` is used.
+    :param rng: a :class:`random.Random` instance, a private one by default.
+    :param block_size: the number of texts drawn at once. The texts of a
+                       seed depend on it.
+    """
+    def __init__(self, length=4, count=None, seed=None, rng=None,
+                 block_size=1024):
+        self.length = _length_range(length)
+        self.count = count
+        self.seed = seed
+        self._rng = rng if rng is not None else random.Random()
+        self.block_size = block_size
+
+    def __len__(self):
+        if self.count is None:
+            raise TypeError('an endless text source has no length')
+        return self.count
+
+    def __iter__(self):
+        if self.seed is not None:
+            rng = random.Random(self.seed)
+        else:
+            rng = self._rng
+        if self.count is None:
+            counter = itertools.count()
+        else:
+            counter = range(0, self.count, self.block_size)
+        for start in counter:
+            n = self.block_size
+            if self.count is not None:
+                n = min(n, self.count - start)
+            for text in self.draw_block(rng, n):
+                yield text
+
+    def take(self, n):
+        """Return the first ``n`` texts as a list."""
+        return list(itertools.islice(self, n))
+
+    def draw_lengths(self, rng, n):
+        """Draw the lengths of ``n`` texts."""
+        low, high = self.length
+        if low == high:
+            return [low] * n
+        return _draw_ints(rng, n, low, high)
+
+    def draw_block(self, rng, n):
+        """Return a list of ``n`` new texts drawn from ``rng``."""
+        raise NotImplementedError()
+
+
+class UniformText(TextSource):
+    """Texts of characters picked uniformly from an alphabet.
+
+    :param alphabet: the characters, a string or a sequence of strings.
+    :param unique: no character more than once in a text, like
+                   :meth:`AudioCaptcha.random <captcha.audio.AudioCaptcha.random>`.
+                   The texts are drawn one by one then.
+
+    The other parameters are those of :class:`TextSource`.
+    """
+    def __init__(self, alphabet, length=4, unique=False, **kwargs):
+        super(UniformText, self).__init__(length, **kwargs)
+        self.alphabet = list(alphabet)
+        self.unique = unique
+        if unique and self.length[1] > len(self.alphabet):
+            raise ValueError('texts longer than the alphabet must repeat')
+
+    def draw_block(self, rng, n):
+        lengths = self.draw_lengths(rng, n)
+        alphabet = self.alphabet
+        if self.unique:
+            return [''.join(rng.sample(alphabet, k)) for k in lengths]
+        picks = _draw_ints(rng, sum(lengths), 0, len(alphabet) - 1)
+        return _split(alphabet, picks, lengths)
+
+
+class WeightedText(TextSource):
+    """Texts of characters picked with the given weights, like
+    :func:`random.choices`.
+
+    :param weights: a dict of the characters to their weights.
+
+    The other parameters are those of :class:`TextSource`.
+    """
+    def __init__(self, weights, length=4, **kwargs):
+        super(WeightedText, self).__init__(length, **kwargs)
+        self.alphabet = list(weights)
+        self.cum_weights = []
+        total = 0
+        for c in self.alphabet:
+            total += weights[c]
+            self.cum_weights.append(total)
+        if not self.cum_weights or self.cum_weights[-1] <= 0:
+            raise ValueError('the total of the weights must be positive')
+
+    def draw_block(self, rng, n):
+        lengths = self.draw_lengths(rng, n)
+        cum_weights = self.cum_weights
+        total = cum_weights[-1] + 0.0
+        hi = len(cum_weights) - 1
+        values = _draw_floats(rng, sum(lengths))
+        if numpy is not None:
+            picks = numpy.searchsorted(
+                numpy.array(cum_weights, dtype=numpy.float64),
+                numpy.array(values) * total, side='right')
+            picks = numpy.minimum(picks, hi).tolist()
+        else:
+            picks = [bisect.bisect(cum_weights, v * total, 0, hi)
+                     for v in values]
+        return _split(self.alphabet, picks, lengths)
+
+
+class DictionaryText(TextSource):
+    """Texts of words picked uniformly from a word list.
+
+    :param words: a sequence of words, or a :class:`WordList`.
+    :param length: the number of words of a text, or a ``(min, max)``
+                   range.
+    :param sep: the separator of the words.
+
+    The other parameters are those of :class:`TextSource`.
+    """
+    def __init__(self, words, length=1, sep='', **kwargs):
+        super(DictionaryText, self).__init__(length, **kwargs)
+        if not len(words):
+            raise ValueError('the word list is empty')
+        self.words = words
+        self.sep = sep
+
+    def draw_block(self, rng, n):
+        lengths = self.draw_lengths(rng, n)
+        picks = _draw_ints(rng, sum(lengths), 0, len(self.words) - 1)
+        return _split(self.words, picks, lengths, self.sep)
+
+
+def _split(units, picks, lengths, sep=''):
+    rv = []
+    pos = 0
+    for k in lengths:
+        rv.append(sep.join([units[i] for i in picks[pos:pos + k]]))
+        pos += k
+    return rv
+
+
+class WordList(object):
+    """A word list file, one word per line, in UTF-8.
+
+    The file is memory mapped, only the offsets of the lines are kept in
+    memory, so the list can be larger than the memory.
+
+    :param path: the word list file path.
+    """
+    def __init__(self, path):
+        self._open(path)
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self._open(state['path'])
+
+    def _open(self, path):
+        self.path = path
+        self._mmap = None
+        self._ends = array.array('q')
+        if not os.path.getsize(path):
+            return
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        size = len(self._mmap)
+        if numpy is not None:
+            data = numpy.frombuffer(self._mmap, dtype=numpy.uint8)
+            ends = numpy.flatnonzero(data == 10).astype(numpy.int64)
+            self._ends.frombytes(ends.tobytes())
+            del data
+        else:
+            pos = self._mmap.find(b'\n')
+            while pos != -1:
+                self._ends.append(pos)
+                pos = self._mmap.find(b'\n', pos + 1)
+        if not self._ends or self._ends[-1] != size - 1:
+            # the last line has no line break
+            self._ends.append(size)
+
+    def __len__(self):
+        return len(self._ends)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        start = self._ends[i - 1] + 1 if i else 0
+        word = self._mmap[start:self._ends[i]]
+        return word.decode('utf-8').rstrip('\r')
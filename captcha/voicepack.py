@@ -0,0 +1,128 @@
+# coding: utf-8
+"""
+    captcha.voicepack
+    ~~~~~~~~~~~~~~~~~
+
+    Pack a voice data library into one indexed file, and load it with mmap.
+
+    A voice pack holds the decoded frames of every wave file of a voice
+    data library. Loading it only reads the index, the samples are pages
+    of a read-only memory map, which the operating system shares between
+    every process using the same pack::
+
+        $ python -m captcha.voicepack /path/to/voices voices.pack
+
+        captcha = AudioCaptcha(voicepack='voices.pack')
+"""
+
+import os
+import sys
+import mmap
+import wave
+import struct
+
+__all__ = ['compile_voicepack', 'VoicePack']
+
+MAGIC = b'CAVP'
+VERSION = 1
+_HEADER = struct.Struct('<4sII')
+_ENTRY = struct.Struct('<HQQ')
+
+
+def _voice_files(voicedir):
+    for name in sorted(os.listdir(voicedir)):
+        dirname = os.path.join(voicedir, name)
+        if len(name) != 1 or not os.path.isdir(dirname):
+            continue
+        for f in sorted(os.listdir(dirname)):
+            filepath = os.path.join(dirname, f)
+            if f.endswith('.wav') and os.path.isfile(filepath):
+                yield name, filepath
+
+
+def compile_voicepack(voicedir, output):
+    """Pack the voice data library ``voicedir`` into the file ``output``.
+    Returns the number of samples.
+
+    :param voicedir: the voice data library directory, see
+                     :class:`captcha.audio.AudioCaptcha`.
+    :param output: the voice pack file path.
+    """
+    from captcha.audio import _read_wave_file
+
+    # the sizes come from the wave headers, so that only one sample is in
+    # memory at a time
+    samples = []
+    for name, filepath in _voice_files(voicedir):
+        w = wave.open(filepath)
+        length = w.getnframes() * w.getsampwidth() * w.getnchannels()
+        w.close()
+        samples.append((name.encode('utf-8'), filepath, length))
+
+    offset = _HEADER.size + sum(_ENTRY.size + len(name)
+                                for name, _, _ in samples)
+    with open(output, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(samples)))
+        for name, _, length in samples:
+            f.write(_ENTRY.pack(len(name), offset, length))
+            f.write(name)
+            offset += length
+        for _, filepath, length in samples:
+            data = _read_wave_file(filepath)
+            if len(data) != length:
+                raise ValueError('%r is truncated' % filepath)
+            f.write(data)
+    return len(samples)
+
+
+class VoicePack(object):
+    """A voice pack file created by :func:`compile_voicepack`.
+
+    The samples are read-only memoryviews of the memory mapped file.
+
+    :param path: the voice pack file path.
+    """
+    def __init__(self, path):
+        self._open(path)
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self._open(state['path'])
+
+    def _open(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%r is not a voice pack' % path)
+
+        view = memoryview(self._mmap)
+        self._samples = {}
+        pos = _HEADER.size
+        for _ in range(count):
+            size, offset, length = _ENTRY.unpack_from(self._mmap, pos)
+            pos += _ENTRY.size
+            name = self._mmap[pos:pos + size].decode('utf-8')
+            pos += size
+            sample = view[offset:offset + length]
+            self._samples.setdefault(name, []).append(sample)
+
+    @property
+    def choices(self):
+        """The characters in this voice pack."""
+        return sorted(self._samples)
+
+    def samples(self, name):
+        """The samples of the character ``name``."""
+        return self._samples[name]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.stderr.write('usage: python -m captcha.voicepack VOICEDIR OUTPUT\n')
+        sys.exit(2)
+    print('%d samples' % compile_voicepack(sys.argv[1], sys.argv[2]))
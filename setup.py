@@ -13,6 +13,7 @@ from email.utils import parseaddr
 kwargs = {}
 if not hasattr(sys, 'pypy_version_info'):
     kwargs['install_requires'] = ['Pillow']
+    kwargs['extras_require'] = {'numpy': ['numpy']}
 
 author, author_email = parseaddr(captcha.__author__)
 
@@ -34,6 +35,9 @@ setup(
     license='BSD',
     zip_safe=False,
     include_package_data=True,
+    entry_points={
+        'console_scripts': ['captcha-gen = captcha.cli:main'],
+    },
     tests_require=['nose'],
     test_suite='nose.collector',
     classifiers=[
@@ -0,0 +1,82 @@
+# coding: utf-8
+
+import sys
+
+if sys.version_info >= (3, 5):
+    import asyncio
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    from captcha.audio import AudioCaptcha
+
+    def test_audio_agenerate():
+        captcha = AudioCaptcha()
+        captcha.configure_async(ThreadPoolExecutor(2), max_concurrency=1)
+
+        async def run():
+            return await asyncio.gather(*[
+                captcha.agenerate('1234') for _ in range(3)
+            ])
+
+        results = asyncio.new_event_loop().run_until_complete(run())
+        assert len(results) == 3
+        assert all(bytearray(b'RIFF') in data for data in results)
+
+    def test_audio_agenerate_processes():
+        captcha = AudioCaptcha(seed=1)
+        with ProcessPoolExecutor(1) as executor:
+            captcha.configure_async(executor)
+
+            async def run():
+                first = await captcha.agenerate('1234')
+                second = await captcha.agenerate('1234')
+                return first, second
+
+            first, second = asyncio.new_event_loop().run_until_complete(run())
+        assert first != second
+
+    def test_audio_agenerate_worker_processes():
+        captcha = AudioCaptcha(seed=1)
+        captcha.configure_async(processes=1)
+        try:
+            async def run():
+                first = await captcha.agenerate('1234')
+                second = await captcha.agenerate('1234')
+                return first, second
+
+            first, second = asyncio.new_event_loop().run_until_complete(run())
+        finally:
+            captcha._async_runner.close()
+        assert bytearray(b'RIFF') in first
+        assert first != second
+
+    class _Slow(object):
+        def __init__(self):
+            self.running = 0
+            self.most = 0
+
+        def generate(self, chars):
+            import time
+            self.running += 1
+            self.most = max(self.most, self.running)
+            time.sleep(0.05)
+            self.running -= 1
+            return chars
+
+    def test_agenerate_cancel_keeps_bound():
+        from captcha._asyncio import AsyncRunner
+
+        captcha = _Slow()
+        runner = AsyncRunner(ThreadPoolExecutor(8), max_concurrency=1)
+
+        async def run():
+            tasks = [asyncio.ensure_future(runner.call(captcha, 'generate', i))
+                     for i in range(4)]
+            await asyncio.sleep(0.01)
+            for task in tasks:
+                task.cancel()
+            return await asyncio.gather(*[
+                runner.call(captcha, 'generate', i) for i in range(3)])
+
+        results = asyncio.new_event_loop().run_until_complete(run())
+        assert results == [0, 1, 2]
+        assert captcha.most == 1
@@ -1,6 +1,9 @@
 # coding: utf-8
 
-from captcha.audio import AudioCaptcha
+import pickle
+from io import BytesIO
+
+from captcha.audio import AudioCaptcha, VariantCache
 
 
 def test_audio_generate():
@@ -10,7 +13,119 @@ def test_audio_generate():
     assert bytearray(b'RIFF') in data
 
 
+def test_audio_seed():
+    data = AudioCaptcha(seed=7).generate('1234')
+    assert AudioCaptcha(seed=7).generate('1234') == data
+
+    import random
+    captcha = pickle.loads(pickle.dumps(AudioCaptcha(rng=random)))
+    assert captcha.rng is random
+
+
+def test_audio_stream():
+    data = AudioCaptcha(seed=7).generate('1234')
+    chunks = list(AudioCaptcha(seed=7).stream('1234', chunk_size=1024))
+    assert all(isinstance(chunk, bytes) for chunk in chunks)
+    assert max(len(chunk) for chunk in chunks) <= 1024
+    assert b''.join(chunks) == data
+
+    out = BytesIO()
+    assert AudioCaptcha(seed=7).write('1234', out) == len(data)
+    assert out.getvalue() == data
+
+
+def test_audio_variant_cache():
+    data = AudioCaptcha(seed=7).generate('1234')
+    cache = VariantCache()
+    captcha = AudioCaptcha(seed=7, variant_cache=cache)
+    assert captcha.generate('1234') == data
+    assert cache.stats()['misses'] > 0
+
+    cache = VariantCache(maxbytes=1024 * 1024)
+    captcha = AudioCaptcha(seed=7, variant_cache=cache)
+    assert captcha.prepare_variants(voices=False) > 0
+    assert 0 < cache.nbytes <= 1024 * 1024
+    assert captcha.generate('1234') == data
+
+
+def test_audio_noise_beds():
+    captcha = AudioCaptcha(seed=7, noise_beds=2)
+    captcha.load()
+    assert len(captcha._noise_beds) == 2
+    data = captcha.generate('1234')
+    assert bytearray(b'RIFF') in data
+    assert AudioCaptcha(seed=7, noise_beds=2).generate('1234') == data
+
+    # the beds do not depend on the sample generated first, and are made
+    # again in a copy instead of being pickled
+    captcha.reseed(7, index=2)
+    sample = captcha.generate('1234')
+    other = AudioCaptcha(seed=7, noise_beds=2)
+    other.reseed(7, index=2)
+    assert other.generate('1234') == sample
+    copy = pickle.loads(pickle.dumps(captcha))
+    assert len(pickle.dumps(captcha)) < 200 * 1024
+    copy.reseed(7, index=2)
+    assert copy.generate('1234') == sample
+
+    # without a seed, the beds are private to an instance and its copies
+    first = AudioCaptcha(noise_beds=1)
+    first.load()
+    second = AudioCaptcha(noise_beds=1)
+    second.load()
+    assert first._noise_beds != second._noise_beds
+    copy = pickle.loads(pickle.dumps(first))
+    copy.load()
+    assert copy._noise_beds == first._noise_beds
+
+    first.prepare_noise_beds(1, seconds=1, offset=False, gain=False,
+                             reverse=False)
+    noise = first.create_background_noise(2000, '1')
+    assert noise == first._noise_beds[0][:2000]
+
+    # a background longer than the beds is made from scratch
+    captcha.prepare_noise_beds(1, seconds=0.1)
+    assert len(captcha.create_background_noise(2000, '1')) == 2000
+    assert len(captcha.create_background_noise(20000, '1')) >= 20000
+
+
 def test_audio_random():
     captcha = AudioCaptcha()
     data = captcha.random(4)
     assert len(data) == 4
+    data = captcha.random(20, allow_repeat=True)
+    assert len(data) == 20
+    assert set(data) <= set(captcha.choices)
+
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+if numpy is not None:
+    import random
+    from captcha import audio
+    from captcha import _audio_numpy
+
+    def test_numpy_engine_matches_python():
+        body = audio.BEEP
+        for speed in (0.9, 1.13, 1.4):
+            assert (_audio_numpy.change_speed(body, speed) ==
+                    audio._py_change_speed(body, speed))
+        for level in (0.3, 0.87, 1.18):
+            assert (_audio_numpy.change_sound(body, level) ==
+                    audio._py_change_sound(body, level))
+
+        noise = audio._py_create_noise(len(body))
+        for src, dst in ((body, noise[:100]), (body[:100], noise)):
+            expected = audio._py_mix_wave(bytearray(src), bytearray(dst))
+            mixed = _audio_numpy.mix_wave(bytearray(src), bytearray(dst))
+            assert expected == mixed
+
+        random.seed(42)
+        expected = audio._py_create_noise(5000)
+        state = random.getstate()
+        random.seed(42)
+        assert _audio_numpy.create_noise(5000) == expected
+        assert random.getstate() == state
@@ -0,0 +1,43 @@
+# coding: utf-8
+
+import pickle
+
+from captcha.cache import LRUCache
+
+
+def test_lru_cache_evicts_by_size():
+    cache = LRUCache(maxbytes=10, sizeof=len)
+    cache.set('a', b'12345')
+    cache.set('b', b'12345')
+    assert cache.get('a') == b'12345'
+    cache.set('c', b'123')
+    assert 'b' not in cache
+    assert cache.get('b') is None
+    assert cache.nbytes == 8
+
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['evictions'] == 1
+
+
+def test_lru_cache_pickle():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    copied = pickle.loads(pickle.dumps(cache))
+    assert len(copied) == 0
+    assert copied.maxsize == 2
+    copied.set('a', 1)
+    assert copied.get('a') == 1
+
+
+def test_lru_cache_resize():
+    cache = LRUCache(maxsize=3, maxbytes=10, sizeof=len)
+    for key in 'abc':
+        cache.set(key, b'123')
+    cache.resize(maxsize=2)
+    assert cache.maxbytes == 10
+    assert len(cache) == 2 and 'a' not in cache
+    cache.resize(maxbytes=None)
+    assert cache.maxsize == 2
+    assert cache.maxbytes is None
@@ -0,0 +1,45 @@
+# coding: utf-8
+
+import os
+import shutil
+import tempfile
+
+from captcha.cli import main, MANIFEST
+from captcha.dataset import Dataset
+
+
+def test_cli_files():
+    directory = tempfile.mkdtemp()
+    try:
+        argv = ['-n', '5', '-l', '3-5', '-j', '0', '--seed', '1', '-q',
+                directory]
+        assert main(argv) == 0
+        names = sorted(os.listdir(directory))
+        assert names[-1] == MANIFEST
+        assert len(names) == 6
+        assert names[0].startswith('00000000_')
+        assert names[0].endswith('.png')
+
+        with open(os.path.join(directory, names[2]), 'rb') as f:
+            data = f.read()
+        os.remove(os.path.join(directory, names[2]))
+        assert main(argv) == 2
+        assert main(['--resume', '-j', '0', '-q', directory]) == 0
+        assert sorted(os.listdir(directory)) == names
+        with open(os.path.join(directory, names[2]), 'rb') as f:
+            assert f.read() == data
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_cli_shards():
+    directory = tempfile.mkdtemp()
+    try:
+        argv = ['-n', '5', '-j', '0', '--layout', 'shards',
+                '--shard-size', '2', '-q', directory]
+        assert main(argv) == 0
+        dataset = Dataset(directory)
+        assert len(dataset) == 5
+        assert len(dataset.labels[0]) == 4
+    finally:
+        shutil.rmtree(directory)
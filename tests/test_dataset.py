@@ -0,0 +1,32 @@
+# coding: utf-8
+
+import os
+import shutil
+import tempfile
+
+from captcha.image import ImageCaptcha
+from captcha.dataset import write_dataset, Dataset
+
+
+def test_dataset():
+    directory = tempfile.mkdtemp()
+    try:
+        captcha = ImageCaptcha()
+        texts = ['%04d' % i for i in range(7)]
+        assert write_dataset(captcha, texts, directory, shard_size=3,
+                             workers=0, seed=1) == 7
+        dataset = Dataset(directory)
+        assert len(dataset) == 7
+        assert dataset.labels == texts
+        label, data = dataset[4]
+        assert label == '0004'
+        assert bytes(data[:4]) == b'\x89PNG'
+        assert dataset.image(-1).size == (160, 60)
+
+        # an interrupted run only writes the missing shards again
+        os.remove(os.path.join(directory, 'shard-00001.index'))
+        assert write_dataset(captcha, texts, directory, shard_size=3,
+                             workers=0, seed=1) == 3
+        assert bytes(Dataset(directory)[4][1]) == bytes(data)
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,44 @@
+# coding: utf-8
+
+import os
+
+from captcha.fonts import FontCache
+
+ROOT = os.path.abspath(os.path.dirname(__file__))
+FONT = os.path.join(ROOT, 'Vera.ttf')
+
+
+def test_font_cache():
+    cache = FontCache(maxsize=2)
+    font = cache.get_font(FONT, 20)
+    assert cache.get_font(FONT, 20) is font
+    cache.get_font(FONT, 30)
+    cache.get_font(FONT, 40)
+    assert len(cache) == 2
+    assert cache.get_font(FONT, 20) is not font
+
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['evictions'] == 2
+
+
+def test_font_metrics():
+    import tempfile
+    from captcha.fonts import FontMetrics
+
+    font = FontCache().get_font(FONT, 20)
+    metrics = FontMetrics()
+    metrics.prepare(font, 'ab ')
+    width, height, ink = metrics.get(font, 'a')
+    assert 0 <= ink[0] < ink[2] <= width
+    assert metrics.get(font, ' ')[2] is None
+
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        metrics.save(path)
+        loaded = FontMetrics()
+        assert loaded.load(path)
+        assert loaded.get(font, 'a') == (width, height, ink)
+    finally:
+        os.remove(path)
@@ -13,3 +13,176 @@ if not hasattr(sys, 'pypy_version_info'):
         captcha = WheezyCaptcha()
         data = captcha.generate('1234')
         assert hasattr(data, 'read')
+
+    def test_wheezy_pipeline():
+        import pickle
+        captcha = WheezyCaptcha(160, 60)
+        pipeline = captcha.pipeline
+        assert captcha.generate_image('1234').size == (160, 60)
+        assert captcha.pipeline is pipeline
+
+        captcha = pickle.loads(pickle.dumps(captcha))
+        assert captcha.generate_image('1234').size == (160, 60)
+
+    if sys.version_info >= (3, 5):
+        def test_wheezy_agenerate_processes():
+            import asyncio
+            from concurrent.futures import ProcessPoolExecutor
+
+            captcha = WheezyCaptcha()
+            with ProcessPoolExecutor(1) as executor:
+                captcha.configure_async(executor)
+                loop = asyncio.new_event_loop()
+                data = loop.run_until_complete(captcha.agenerate('1234'))
+            assert data.getvalue().startswith(b'\x89PNG')
+
+    def test_image_glyph_cache():
+        captcha = ImageCaptcha(font_sizes=(42,))
+        captcha.generate('1111')
+        stats = captcha.glyph_cache.stats()
+        assert stats['misses'] == 1
+        assert stats['hits'] == 3
+
+    def test_image_background():
+        for legacy in (False, True):
+            captcha = ImageCaptcha(width=200, height=80, legacy=legacy)
+            im = captcha.create_captcha_background((0, 0, 0, 255))
+            assert im.size == (200, 80)
+            assert im.mode == 'RGB'
+
+    def test_image_seed():
+        first = ImageCaptcha(seed=7).generate('1234').getvalue()
+        captcha = ImageCaptcha(seed=7)
+        assert captcha.generate('1234').getvalue() == first
+        assert captcha.generate('1234').getvalue() != first
+
+        captcha.reseed(7, index=3)
+        sample = captcha.generate('1234').getvalue()
+        captcha.reseed(7, index=3)
+        assert captcha.generate('1234').getvalue() == sample
+
+        import pickle
+        import random
+        captcha = pickle.loads(pickle.dumps(ImageCaptcha(rng=random)))
+        assert captcha.rng is random
+
+    def test_image_generate_batch():
+        captcha = ImageCaptcha()
+        texts = ['1234', 'abcd', '5678']
+        first = list(captcha.generate_batch(texts, workers=2, seed=1))
+        assert len(first) == len(texts)
+        assert first == list(captcha.generate_batch(texts, workers=0, seed=1))
+        captcha.reseed(1, index=2)
+        assert captcha.generate(texts[2]).getvalue() == first[2]
+        assert first[0].startswith(b'\x89PNG')
+
+    def test_image_paste_characters():
+        from PIL import Image, ImageChops
+
+        image = Image.new('RGB', (160, 60), (255, 255, 255))
+        glyphs = [ImageCaptcha()._draw_character(c) for c in 'abc']
+        images = []
+        for legacy in (True, False):
+            captcha = ImageCaptcha(seed=3, legacy=legacy)
+            images.append(captcha._paste_characters(
+                image.copy(), glyphs, (0, 0, 0), (200, 10, 10), 8, 4))
+        extrema = ImageChops.difference(*images).getextrema()
+        assert max(high for _, high in extrema) <= 4
+
+    def test_image_shared_fonts():
+        from captcha.fonts import FontCache
+
+        cache = FontCache()
+        first = ImageCaptcha(font_sizes=(42, 50), font_cache=cache)
+        second = ImageCaptcha(font_sizes=(42, 50), font_cache=cache)
+        first.generate('1')
+        assert 1 <= len(cache) <= 2
+        assert first.truefonts == second.truefonts
+        assert len(cache) == 2
+
+    def test_image_generate_array():
+        import numpy
+
+        captcha = ImageCaptcha(seed=5)
+        array = captcha.generate_array('1234')
+        assert array.shape == (60, 160, 3)
+        assert array.dtype == numpy.uint8
+        gray = captcha.generate_array('1234', grayscale=True, normalize=True)
+        assert gray.shape == (60, 160, 1)
+        assert 0 <= gray.min() and gray.max() <= 1
+
+        buf = numpy.zeros((4, 60, 160, 3), numpy.uint8)
+        rv = captcha.generate_arrays(['12', '34'], out=buf, seed=1)
+        assert rv is buf
+        assert buf[0].any() and not buf[2].any()
+        captcha.reseed(1, index=1)
+        assert (captcha.generate_array('34') == buf[1]).all()
+
+    def test_image_noise():
+        from PIL import Image
+
+        captcha = ImageCaptcha(seed=2)
+        im = Image.new('RGB', (160, 60), (0, 0, 0))
+        assert captcha._create_noise(im, (255, 0, 0, 255), 40, 0) is im
+        assert im.getbbox() is not None
+        im = Image.new('RGB', (160, 60), (0, 0, 0))
+        captcha._create_noise(im, (255, 0, 0, 255), 0, 10)
+        assert im.getbbox() is not None
+
+    def test_image_encoder_profiles():
+        from io import BytesIO
+
+        captcha = ImageCaptcha(seed=1)
+        sizes = {}
+        for profile in ('fast', 'balanced', 'small'):
+            captcha.reseed(1)
+            sizes[profile] = len(captcha.generate('1234', profile=profile).getvalue())
+        assert sizes['small'] <= sizes['fast']
+
+        captcha.reseed(1)
+        data = captcha.generate('1234', quantize=64).getvalue()
+        assert len(data) < sizes['small']
+
+        out = BytesIO(b'x' * 100000)
+        assert captcha.generate('1234', 'jpeg', 'fast', out=out) is out
+        assert out.getvalue().startswith(b'\xff\xd8')
+        assert out.tell() == 0
+
+        try:
+            captcha.generate('1234', 'jpeg', quantize=64)
+        except ValueError:
+            pass
+        else:
+            assert False, 'JPEG cannot be quantized'
+
+    def test_image_threadsafe():
+        import threading
+        from captcha.rng import ThreadLocalRandom
+
+        captcha = ImageCaptcha(threadsafe=True, seed=1)
+        assert isinstance(captcha.rng, ThreadLocalRandom)
+        results = []
+
+        def run():
+            rv = [captcha.generate('%04d' % i).getvalue() for i in range(10)]
+            results.append(rv)
+
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(results) == 4
+        assert all(data.startswith(b'\x89PNG') for rv in results for data in rv)
+        # every thread draws its own random sequence
+        assert len(set(rv[0] for rv in results)) == 4
+
+        try:
+            captcha.set_size(100, 40)
+        except RuntimeError:
+            pass
+        else:
+            assert False, 'set_size must fail'
+        small = captcha.with_size(100, 40)
+        assert small.generate_image('12').size == (100, 40)
+        assert captcha.generate_image('12').size == (160, 60)
@@ -0,0 +1,50 @@
+# coding: utf-8
+
+import sys
+
+if not hasattr(sys, 'pypy_version_info'):
+    from captcha.image import ImageCaptcha
+    from captcha.instrument import Histogram, StatsCollector
+
+    def test_histogram():
+        hist = Histogram(buckets=(1, 10))
+        for value in (0.5, 2, 20, 30):
+            hist.observe(value)
+        data = hist.as_dict()
+        assert data['buckets'] == [(1, 1), (10, 2), ('+Inf', 4)]
+        assert data['count'] == 4
+        assert data['max'] == 30
+
+    def test_stats_collector():
+        stats = StatsCollector()
+        captcha = ImageCaptcha(instrument=stats)
+        captcha.generate('1234')
+        data = stats.stats()
+        for stage in ('background', 'char_draw', 'paste', 'noise',
+                      'generate_image', 'encode'):
+            assert data['times'][stage]['count'] >= 1
+        assert data['times']['char_transform']['count'] == 4
+        assert data['knobs']['text_length'] == {4: 1}
+        assert len(data['knobs']['smooth']) == 1
+
+    def test_nested_allocations():
+        import pickle
+        stats = StatsCollector(trace_allocations=True)
+
+        def outer():
+            data = bytearray(4 * 1024 * 1024)
+            del data
+            stats.measure('inner', bytearray, 1024)
+
+        try:
+            stats.measure('outer', outer)
+        finally:
+            import tracemalloc
+            tracemalloc.stop()
+        allocations = stats.stats()['allocations']
+        assert allocations['outer']['max'] >= 4 * 1024 * 1024
+        assert allocations['inner']['max'] < 1024 * 1024
+
+        captcha = ImageCaptcha(instrument=stats)
+        captcha = pickle.loads(pickle.dumps(captcha))
+        assert captcha.instrument is None
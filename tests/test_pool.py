@@ -0,0 +1,85 @@
+# coding: utf-8
+
+import time
+
+from captcha.audio import AudioCaptcha
+from captcha.pool import CaptchaPool
+
+
+def test_pool():
+    pool = CaptchaPool(AudioCaptcha(), high=4, low=2)
+    text, data = pool.get()
+    assert len(text) == 6
+    assert bytearray(b'RIFF') in data
+    assert pool.stats()['misses'] == 1
+
+    pool.start()
+    try:
+        for _ in range(200):
+            if len(pool) == 4:
+                break
+            time.sleep(0.05)
+        assert len(pool) == 4
+        pool.get()
+        stats = pool.stats()
+        assert stats['hits'] == 1
+        assert stats['generated'] >= 4
+    finally:
+        pool.stop()
+
+
+class _Flaky(object):
+    def __init__(self):
+        self.calls = 0
+
+    def generate(self, text):
+        self.calls += 1
+        if self.calls == 1:
+            raise IOError('transient')
+        return text
+
+
+def test_pool_refill_error():
+    pool = CaptchaPool(_Flaky(), text=lambda: '1234', high=3, low=2)
+    pool.start()
+    pool.start()
+    try:
+        assert len(pool._threads) == 1
+        for _ in range(200):
+            if len(pool) == 3:
+                break
+            time.sleep(0.05)
+        assert len(pool) == 3
+        stats = pool.stats()
+        assert stats['errors'] == 1
+        assert stats['generated'] == 3
+        assert pool._threads[0].is_alive()
+    finally:
+        pool.stop()
+
+
+class _Echo(object):
+    def generate(self, text):
+        return text
+
+
+def test_pool_low_zero():
+    pool = CaptchaPool(_Echo(), text=lambda: '1234', high=2, low=0)
+    pool._pending = 1
+    pool.fill()
+    assert len(pool) == 1
+    pool._pending = 0
+    pool.fill()
+    assert len(pool) == 2
+
+    pool.start()
+    try:
+        pool.get()
+        pool.get()
+        for _ in range(200):
+            if len(pool) == 2:
+                break
+            time.sleep(0.05)
+        assert len(pool) == 2
+    finally:
+        pool.stop()
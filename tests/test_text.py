@@ -0,0 +1,56 @@
+# coding: utf-8
+
+import os
+import tempfile
+
+from captcha import text
+from captcha.text import UniformText, WeightedText, DictionaryText, WordList
+
+
+def test_uniform_text():
+    source = UniformText('abc', length=(2, 5), count=2500, seed=1,
+                         block_size=1000)
+    texts = list(source)
+    assert len(texts) == len(source) == 2500
+    assert list(source) == texts
+    assert set(''.join(texts)) == set('abc')
+    assert set(len(t) for t in texts) == set(range(2, 6))
+
+    texts = UniformText('abcd', length=4, unique=True, seed=1).take(10)
+    assert all(sorted(t) == list('abcd') for t in texts)
+
+
+def test_weighted_text():
+    texts = WeightedText({'a': 1, 'b': 0, 'c': 3}, length=8, seed=2).take(100)
+    chars = ''.join(texts)
+    assert 'b' not in chars
+    assert chars.count('c') > chars.count('a')
+
+
+def test_dictionary_text():
+    fd, path = tempfile.mkstemp()
+    with os.fdopen(fd, 'wb') as f:
+        f.write(u'apple\nbanana\r\ncherry\nété'.encode('utf-8'))
+    try:
+        words = WordList(path)
+        assert len(words) == 4
+        assert words[1] == 'banana'
+        assert words[-1] == u'été'
+        texts = DictionaryText(words, length=2, sep=' ', seed=3).take(20)
+        assert all(len(t.split(' ')) == 2 for t in texts)
+    finally:
+        os.remove(path)
+
+
+def test_text_without_numpy():
+    sources = [
+        UniformText('abcdef', length=(3, 6), seed=4),
+        WeightedText({'x': 1, 'y': 2.5, 'z': 0.5}, seed=4),
+    ]
+    expected = [source.take(3000) for source in sources]
+    numpy = text.numpy
+    text.numpy = None
+    try:
+        assert [source.take(3000) for source in sources] == expected
+    finally:
+        text.numpy = numpy
@@ -0,0 +1,32 @@
+# coding: utf-8
+
+import os
+import shutil
+import tempfile
+
+from captcha.audio import AudioCaptcha, DATA_DIR, _read_wave_file
+from captcha.voicepack import VoicePack, compile_voicepack
+
+
+def test_voicepack():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'voices.pack')
+        assert compile_voicepack(DATA_DIR, path) == 10
+
+        pack = VoicePack(path)
+        assert pack.choices == list('0123456789')
+        expected = _read_wave_file(os.path.join(DATA_DIR, '7', 'default.wav'))
+        assert pack.samples('7')[0] == expected
+
+        captcha = AudioCaptcha(voicepack=pack)
+        assert sorted(captcha.random(4))[0] in pack.choices
+        data = captcha.generate('1234')
+        assert bytearray(b'RIFF') in data
+
+        # the voice directory and its pack give the same CAPTCHAs
+        captcha = AudioCaptcha(voicepack=pack, seed=3)
+        assert AudioCaptcha(seed=3).generate('1234') == \
+            captcha.generate('1234')
+    finally:
+        shutil.rmtree(tmpdir)